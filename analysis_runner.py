@@ -0,0 +1,188 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+import openai
+
+from config import ANALYSIS_SETTINGS
+from logger import setup_logger
+from analysis_sink import QwenResponse
+from qwen import Qwen
+from segment_parser import Segment, SegmentExtractor
+
+logger = setup_logger('analysis_runner')
+
+
+@dataclass
+class AnalysisChunk:
+    index: int
+    text: str
+    tokens: int
+    origin_ms: Optional[int] = None
+    start_ms: Optional[int] = None
+    end_ms: Optional[int] = None
+
+
+class RateLimiter:
+    """
+    按分钟限制请求数和token数的令牌桶，令牌随时间连续补充
+    limit 为 0 的维度不做限制
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._request_budget = min(self.requests_per_minute,
+                                       self._request_budget + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_budget = min(self.tokens_per_minute,
+                                     self._token_budget + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._request_budget < 1:
+            wait = max(wait, (1 - self._request_budget) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            # 单次请求超过每分钟上限时按上限计算，避免永远等待
+            tokens = min(tokens, self.tokens_per_minute)
+            if self._token_budget < tokens:
+                wait = max(wait, (tokens - self._token_budget) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        # 持锁等待保证先到先得，后来的请求不会插队
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self._request_budget -= 1
+            if self.tokens_per_minute:
+                self._token_budget -= min(tokens, self.tokens_per_minute)
+
+
+def _is_retryable(error: Exception) -> bool:
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError,
+                              openai.APITimeoutError, openai.InternalServerError))
+
+
+class AnalysisRunner:
+    """
+    并发分析字幕块：限制同时进行的请求数和每分钟请求/token数，失败时指数退避重试，
+    无论哪个请求先完成，结果都按字幕块顺序交给 on_result
+    """
+
+    def __init__(self, qwen: Qwen, concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 max_retries: Optional[int] = None, retry_backoff: Optional[float] = None):
+        self.qwen = qwen
+        self.concurrency = concurrency or ANALYSIS_SETTINGS["concurrency"]
+        self.limiter = RateLimiter(
+            ANALYSIS_SETTINGS["requests_per_minute"] if requests_per_minute is None else requests_per_minute,
+            ANALYSIS_SETTINGS["tokens_per_minute"] if tokens_per_minute is None else tokens_per_minute,
+        )
+        self.max_retries = ANALYSIS_SETTINGS["max_retries"] if max_retries is None else max_retries
+        self.retry_backoff = retry_backoff or ANALYSIS_SETTINGS["retry_backoff"]
+
+    async def _analyze(self, chunk: AnalysisChunk, semaphore: asyncio.Semaphore,
+                       on_segment: Optional[Callable[[AnalysisChunk, Segment], Awaitable[None]]] = None
+                       ) -> QwenResponse:
+        # 已交出的分段，重试时新回复中的相同分段不再重复交出
+        emitted = set()
+        # 解析出但还未交出的分段
+        ready: List[Segment] = []
+
+        def emit(segment: Segment) -> None:
+            key = (segment.start_time, segment.end_time)
+            if key not in emitted:
+                emitted.add(key)
+                ready.append(segment)
+
+        async def deliver() -> None:
+            while ready:
+                await on_segment(chunk, ready.pop(0))
+
+        def new_extractor() -> Optional[SegmentExtractor]:
+            return SegmentExtractor(chunk.origin_ms, emit) if on_segment else None
+
+        async def feed(text: str) -> None:
+            extractor.feed(text)
+            await deliver()
+
+        # 命中回复缓存的字幕块不占用并发名额和限流额度；查询sqlite放到线程池中执行，不阻塞其他请求
+        cached = await asyncio.get_running_loop().run_in_executor(None, self.qwen.cached_response, chunk.text)
+        if cached:
+            extractor = new_extractor()
+            if extractor:
+                extractor.feed(cached.answer_content)
+                extractor.finish()
+                await deliver()
+            return cached
+
+        attempt = 0
+        while True:
+            async with semaphore:
+                await self.limiter.acquire(chunk.tokens)
+                extractor = new_extractor()
+                try:
+                    response = await self.qwen.analyze(chunk.text, feed if extractor else None)
+                    if extractor:
+                        extractor.finish()
+                        await deliver()
+                    return response
+                except Exception as e:
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        logger.error(f"字幕块 {chunk.index} 分析失败: {str(e)}")
+                        raise
+                    error = e
+            # 退避等待期间释放并发名额
+            delay = self.retry_backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+            attempt += 1
+            logger.warning(f"字幕块 {chunk.index} 请求失败，{delay:.1f}秒后第{attempt}次重试: {str(error)}")
+            await asyncio.sleep(delay)
+
+    async def run(self, chunks: List[AnalysisChunk],
+                  on_result: Optional[Callable[[AnalysisChunk, QwenResponse], Awaitable[None]]] = None,
+                  on_segment: Optional[Callable[[AnalysisChunk, Segment], Awaitable[None]]] = None,
+                  priorities: Optional[List[float]] = None) -> List[QwenResponse]:
+        """
+        并发分析所有字幕块，返回按字幕块顺序排列的结果
+        on_segment: 回复仍在生成时，每解析出一个完整分段即调用并等待其完成，不保证字幕块顺序；
+                    下游处理不过来时在其中等待，该字幕块的回复读取随之暂停
+        priorities: 每个字幕块的优先级，越大越先请求；结果仍按字幕块顺序交给 on_result
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        order = range(len(chunks))
+        if priorities:
+            order = sorted(order, key=lambda i: priorities[i], reverse=True)
+        # 信号量按先来先得分配，先创建的任务先请求
+        tasks = [None] * len(chunks)
+        for i in order:
+            tasks[i] = asyncio.create_task(self._analyze(chunks[i], semaphore, on_segment))
+        results = []
+        try:
+            # 按顺序等待，先完成的结果在任务中暂存，保证 on_result 按字幕块顺序调用
+            for chunk, task in zip(chunks, tasks):
+                response = await task
+                results.append(response)
+                if on_result:
+                    await on_result(chunk, response)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return results
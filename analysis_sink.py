@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from timecode import TIME_BASE_MARKER, format_srt_time
+
+RESPONSE_HEADER = "=" * 20 + "完整回复" + "=" * 20
+USAGE_HEADER = "Usage:"
+
+
+@dataclass
+class QwenResponse:
+    reasoning_content: str
+    answer_content: str
+    usage: Optional[dict] = None
+
+
+def render_response(response: QwenResponse, origin_ms: Optional[int] = None) -> str:
+    """按原有 .txt 分析结果的格式渲染一次回复"""
+    lines = []
+    if origin_ms is not None:
+        lines.append(f"\n{TIME_BASE_MARKER}{format_srt_time(origin_ms)}")
+    lines.append(f"\n{RESPONSE_HEADER}\n")
+    lines.append(response.answer_content)
+    if response.usage:
+        lines.append(f"\n{USAGE_HEADER}\n{response.usage}")
+    return "\n".join(lines) + "\n\n"
+
+
+class AnalysisSink:
+    """
+    单个分析任务的输出：每次回复追加一条JSONL记录(字幕块序号、时间、回复、思考过程、用量)，
+    可选同时按原有格式写入 .txt；写入经过缓冲，不修改 sys.stdout 等进程全局状态
+    """
+
+    def __init__(self, title: str, output_dir: str = "", render_txt: bool = True,
+                 buffer_size: int = 64 * 1024):
+        self.jsonl_path = os.path.join(output_dir, f"{title}.jsonl")
+        self.txt_path = os.path.join(output_dir, f"{title}.txt") if render_txt else None
+        self.buffer_size = buffer_size
+        self._jsonl = None
+        self._txt = None
+        self._next_chunk_id = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> None:
+        if self._jsonl is None:
+            self._jsonl = open(self.jsonl_path, "a", encoding="utf-8", buffering=self.buffer_size)
+        if self.txt_path and self._txt is None:
+            self._txt = open(self.txt_path, "a", encoding="utf-8", buffering=self.buffer_size)
+
+    def write(self, response: QwenResponse, chunk_id: Optional[int] = None, origin_ms: Optional[int] = None,
+              start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> dict:
+        """
+        写入一次回复
+        chunk_id: 字幕块序号，未指定时按写入顺序编号
+        origin_ms: 紧凑时间戳模式下的时间基准
+        start_ms/end_ms: 字幕块覆盖的时间范围
+        """
+        with self._lock:
+            self._open()
+            if chunk_id is None:
+                chunk_id = self._next_chunk_id
+            self._next_chunk_id = max(self._next_chunk_id, chunk_id + 1)
+            record = {
+                "chunk_id": chunk_id,
+                "origin_ms": origin_ms,
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "answer": response.answer_content,
+                "reasoning": response.reasoning_content,
+                "usage": response.usage,
+                "created": time.time(),
+            }
+            self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self._txt:
+                self._txt.write(render_response(response, origin_ms))
+            return record
+
+    def flush(self) -> None:
+        with self._lock:
+            for f in (self._jsonl, self._txt):
+                if f:
+                    f.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._jsonl, self._txt):
+                if f:
+                    f.close()
+            self._jsonl = self._txt = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
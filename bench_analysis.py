@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from config import ANALYSIS_SETTINGS, QWEN_CONFIG
+from llm_stub import StubLLMServer
+from logger import setup_logger
+from segment_parser import Segment
+from srt_reader import write_synthetic_srt
+from subtitle_process import estimate_tokens, process_subtitle_segments
+
+logger = setup_logger('bench_analysis')
+
+# 与基准结果比较时检查的指标
+_COMPARED_METRICS = ("requests", "tokens_sent", "wall_time")
+
+
+def run_case(stub: StubLLMServer, cues: int, workdir: str, token_budget: Optional[int] = None,
+             compact: Optional[bool] = None, concurrency: Optional[int] = None) -> dict:
+    """用 cues 条字幕的测试文件跑一次完整的分析流程，返回耗时和请求统计"""
+    srt_file = os.path.join(workdir, f"bench_{cues}.srt")
+    write_synthetic_srt(srt_file, cues)
+    requests, errors = stub.stats.requests, stub.stats.errors
+    prompts = len(stub.stats.prompts)
+    segments: List[Segment] = []
+    first_segment = None
+
+    started = time.perf_counter()
+
+    async def on_segment(segment: Segment) -> None:
+        nonlocal first_segment
+        if first_segment is None:
+            first_segment = time.perf_counter() - started
+        segments.append(segment)
+
+    cwd = os.getcwd()
+    # 分析结果写在当前目录，切换到临时目录避免污染工作目录
+    os.chdir(workdir)
+    try:
+        process_subtitle_segments(srt_file, token_budget, compact, concurrency, use_cache=False,
+                                  on_segment=on_segment)
+    finally:
+        os.chdir(cwd)
+    wall_time = time.perf_counter() - started
+
+    return {
+        "cues": cues,
+        "requests": stub.stats.requests - requests,
+        "errors": stub.stats.errors - errors,
+        "tokens_sent": sum(estimate_tokens(prompt) for prompt in stub.stats.prompts[prompts:]),
+        "segments": len(segments),
+        "wall_time": round(wall_time, 3),
+        "first_segment": round(first_segment, 3) if first_segment is not None else None,
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """与基准结果比较，返回超出容差的指标"""
+    regressions = []
+    expected = {item["cues"]: item for item in baseline}
+    for result in results:
+        base = expected.get(result["cues"])
+        if not base:
+            continue
+        for metric in _COMPARED_METRICS:
+            if base.get(metric) and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{result['cues']} 条字幕 {metric}: {base[metric]} -> {result[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析流程离线性能测试，使用本地模拟的大模型服务')
+    parser.add_argument('--sizes', default="500,5000,20000", help='测试文件的字幕条数，逗号分隔')
+    parser.add_argument('--budget', type=int, default=None, help='每个字幕块的token预算，默认使用配置')
+    parser.add_argument('--compact', action='store_true', help='使用紧凑时间戳')
+    parser.add_argument('--concurrency', type=int, default=None, help='并发请求数，默认使用配置')
+    parser.add_argument('--rpm', type=int, default=0, help='每分钟请求数限制，默认不限制')
+    parser.add_argument('--tokens-per-second', type=float, default=200, help='模拟服务每秒返回的token数')
+    parser.add_argument('--reasoning-tokens', type=int, default=50, help='模拟服务回复前的思考过程token数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务返回错误的概率')
+    parser.add_argument('--error-status', type=int, default=429, help='注入错误的HTTP状态码')
+    parser.add_argument('--seed', type=int, default=0, help='注入错误的随机种子')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--baseline', help='基准结果JSON文件，指标超出容差时以非零状态退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='与基准比较的容差比例')
+    args = parser.parse_args()
+
+    # 限流和重试等待按测试需要调整，避免测量的是等待时间
+    ANALYSIS_SETTINGS["requests_per_minute"] = args.rpm
+    ANALYSIS_SETTINGS["tokens_per_minute"] = 0
+    ANALYSIS_SETTINGS["retry_backoff"] = 0.05
+
+    results = []
+    with StubLLMServer(tokens_per_second=args.tokens_per_second, reasoning_tokens=args.reasoning_tokens,
+                       error_rate=args.error_rate, error_status=args.error_status, seed=args.seed) as stub, \
+            tempfile.TemporaryDirectory() as workdir:
+        QWEN_CONFIG["base_url"] = stub.base_url
+        QWEN_CONFIG["api_key"] = "stub"
+        for cues in (int(size) for size in args.sizes.split(',')):
+            result = run_case(stub, cues, workdir, args.budget, args.compact or None, args.concurrency)
+            results.append(result)
+            logger.info(f"测试完成: {result}")
+
+    print(f"{'字幕数':>8} {'请求数':>6} {'错误':>4} {'发送token':>10} {'分段':>5} {'总耗时(s)':>9} {'首个分段(s)':>10}")
+    for result in results:
+        print(f"{result['cues']:>10} {result['requests']:>9} {result['errors']:>6} {result['tokens_sent']:>13} "
+              f"{result['segments']:>7} {result['wall_time']:>12} {str(result['first_segment']):>14}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"性能退化: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Optional
+
+from config import CLIP_CACHE_SETTINGS
+from logger import setup_logger
+
+logger = setup_logger('clip_cache')
+
+MANIFEST_NAME = "manifest.json"
+# 计算源视频指纹时读取的首尾字节数，避免对多GB文件做完整哈希
+FINGERPRINT_BYTES = 4 * 1024 * 1024
+
+# 进程内按缓存目录共享的实例，同一目录只有一份清单在内存中，多个录像同时切割时不会互相覆盖
+_shared: Dict[str, "ClipCache"] = {}
+_shared_lock = threading.Lock()
+
+
+def source_fingerprint(video_path: str) -> str:
+    """源视频的内容指纹：文件大小加首尾各一段内容的哈希，文件改名或移动后仍然不变"""
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha256(str(size).encode('utf-8'))
+    with open(video_path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(size - FINGERPRINT_BYTES, FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """优先使用硬链接，跨分区等无法链接时复制文件"""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ClipCache:
+    """
+    按内容寻址的切片缓存：以源视频指纹、时间范围和编码参数为键保存切片，
+    重复运行时命中缓存的片段直接硬链接到输出目录，不再重新编码
+    清单文件记录每个缓存项的大小和最近使用时间，总大小超过上限时按最近最少使用淘汰
+    同一缓存目录应通过 get_cache 共用一个实例，各方法可以在多个线程中同时调用
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or CLIP_CACHE_SETTINGS["cache_dir"]
+        self.max_bytes = max_bytes if max_bytes is not None else CLIP_CACHE_SETTINGS["max_bytes"]
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries = self._load_manifest()
+        self._fingerprints = {}
+        self._lock = threading.RLock()
+
+    def _load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("entries", {})
+        except Exception as e:
+            logger.warning(f"缓存清单读取失败，重新建立: {str(e)}")
+            return {}
+
+    def _save_manifest(self) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def make_key(self, video_path: str, start_time: float, end_time: float, profile: dict) -> str:
+        # 同一路径的录像被替换后大小或修改时间会变化，不能沿用旧的指纹
+        stat = os.stat(video_path)
+        memo_key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+        fingerprint = self._fingerprints.get(memo_key)
+        if fingerprint is None:
+            fingerprint = self._fingerprints[memo_key] = source_fingerprint(video_path)
+        identity = {
+            "source": fingerprint,
+            "start": round(start_time, 3),
+            "end": round(end_time, 3),
+            "profile": profile,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """返回有效缓存项的路径，文件缺失或大小不符时删除该项"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            path = self._entry_path(key)
+            if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+                logger.warning(f"缓存项已损坏，丢弃: {path}")
+                self._remove(key)
+                self._save_manifest()
+                return None
+            return path
+
+    def fetch(self, key: str, output_file: str) -> bool:
+        """缓存命中时把切片放到输出路径"""
+        with self._lock:
+            path = self.lookup(key)
+            if not path:
+                return False
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            _link_or_copy(path, output_file)
+            self.entries[key]["last_used"] = time.time()
+            self._save_manifest()
+        logger.info(f"命中切片缓存: {output_file}")
+        return True
+
+    def store(self, key: str, output_file: str, meta: Optional[dict] = None) -> None:
+        """把新切好的片段加入缓存，并在超过容量上限时淘汰旧缓存"""
+        if not os.path.exists(output_file):
+            return
+        path = self._entry_path(key)
+        with self._lock:
+            _link_or_copy(output_file, path)
+            now = time.time()
+            self.entries[key] = {
+                "size": os.path.getsize(path),
+                "created": now,
+                "last_used": now,
+                **(meta or {}),
+            }
+            self.evict()
+            self._save_manifest()
+
+    def _remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+        path = self._entry_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def evict(self) -> None:
+        """按最近使用时间从旧到新淘汰，直到总大小不超过上限"""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            total = sum(entry["size"] for entry in self.entries.values())
+            for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                total -= self.entries[key]["size"]
+                self._remove(key)
+                logger.info(f"淘汰切片缓存: {key}")
+
+
+def get_cache(cache_dir: Optional[str] = None) -> ClipCache:
+    """获取缓存目录共享的缓存实例，首次调用时读取清单"""
+    cache_dir = os.path.abspath(cache_dir or CLIP_CACHE_SETTINGS["cache_dir"])
+    with _shared_lock:
+        if cache_dir not in _shared:
+            _shared[cache_dir] = ClipCache(cache_dir)
+        return _shared[cache_dir]
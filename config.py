@@ -28,4 +28,102 @@ QWEN_CONFIG = {
     "api_key": "sk-xxxxxxx",
     "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
     "model": "qwq-32b",
+    "max_connections": 20,  # 共享连接池的最大连接数
+    "keepalive_expiry": 60,  # 空闲连接保持秒数
+    "read_timeout": 300,  # 流式回复两次数据之间的最长等待秒数
+}
+
+# 视频切片配置
+CUT_SETTINGS = {
+    "mode": "encode",  # encode: 完整重新编码; copy: 关键帧对齐的流复制; smart: 只重编码首尾GOP
+    "ffmpeg_path": "ffmpeg",
+    "ffprobe_path": "ffprobe",
+    "keyframe_search_window": 30,  # 切点对齐到关键帧时允许的最大偏移秒数
+    "preset": "veryfast",  # ffmpeg重编码(智能切割首尾GOP、单次读取模式)使用的x264/x265预设
+    "crf": 18,
+    "workers": 0,  # 并发切割的进程数，0 表示使用CPU核心数
+    "threads_per_worker": 0,  # 每个进程的编码线程数，0 表示按CPU核心数平均分配
+    "worker_sources": 2,  # 每个切割进程保持打开的源视频数，超过时关闭最久未使用的，0 表示不限制
+    "single_pass": False,  # 一次顺序读取源视频输出所有片段，适合机械硬盘；只用于 cut_video(分段编辑后的处理工具)，main.py 边分析边切割时不支持
+    "single_pass_batch": 8,  # 单次读取模式下每个ffmpeg进程同时输出的片段数，0 表示不分批
+    "burn_subtitles": False,  # 切割时把对应时间段的字幕烧录进画面，需要 video_info["srt_path"]
+    "subtitle_style": "FontName=SimHei,FontSize=16,Outline=1",  # 烧录字幕的ASS样式
+}
+
+# 切片缓存配置，重复运行时跳过已切好的片段
+CLIP_CACHE_SETTINGS = {
+    "enabled": True,
+    "cache_dir": os.path.join(OUTPUT_DIR, ".clip_cache"),  # 与输出目录在同一分区时可以使用硬链接
+    "max_bytes": 100 * 1024 ** 3,  # 缓存总大小上限，0 表示不限制
+}
+
+# 多版本输出配置，一次解码同时输出横屏原版、竖屏版(尺寸见 VIDEO_SETTINGS)和纯音频
+RENDITION_SETTINGS = {
+    "renditions": ["landscape"],  # 可选 landscape(原版), vertical(竖屏版), audio(纯音频)
+    "vertical_fit": "pad",  # pad: 完整缩放后上下补黑边; crop: 缩放铺满后裁掉两侧
+    "audio_bitrate": "128k",
+}
+
+# 字幕分析配置
+ANALYSIS_SETTINGS = {
+    "chunk_token_budget": 20000,  # 每次请求的字幕块估算token上限
+    "silence_gap_ms": 2000,  # 字幕间隔超过该值视为停顿，字幕块优先在停顿处断开
+    "chunk_overlap": 10,  # 相邻字幕块重叠的字幕条数
+    "compact_timestamps": False,  # 使用相对字幕块起点的秒数代替完整时间戳，减少token
+    "concurrency": 4,  # 同时进行的分析请求数
+    "requests_per_minute": 60,  # 每分钟请求数上限，0 表示不限制
+    "tokens_per_minute": 0,  # 每分钟估算token数上限，0 表示不限制
+    "max_retries": 3,  # 限流、连接失败和服务端错误的重试次数
+    "retry_backoff": 2.0,  # 重试等待的初始秒数，每次翻倍
+    "render_txt": True,  # 分析结果除 <名称>.jsonl 外，同时按原有格式写入 <名称>.txt
+    "dedup_threshold": 0.6,  # 分段时间重叠(交集/并集)达到该比例视为重复只切一次，0 表示不去重
+    "danmaku_mode": "order",  # 使用字幕旁同名 .xml 弹幕，off: 不使用; order: 弹幕密集处优先分析; filter: 只分析弹幕密集处
+    "danmaku_window": 300,  # 统计弹幕密度的窗口秒数
+    "danmaku_top_ratio": 0.3,  # filter 模式下分析弹幕数排在前多少比例的窗口
+}
+
+# 静音索引配置，切点对齐到附近的静音处，避免在句子中间切断
+SILENCE_SETTINGS = {
+    "enabled": True,
+    "sample_rate": 8000,  # 分析用的单声道PCM采样率
+    "window_ms": 50,  # 计算RMS能量的窗口长度
+    "threshold_db": -40,  # 窗口能量低于该值(dBFS)视为静音
+    "min_silence_ms": 300,  # 短于该时长的静音不作为切点
+    "snap_tolerance": 2.0,  # 切点对齐到静音时允许的最大偏移秒数
+    "padding": 0.15,  # 切点与静音边缘保持的距离(秒)，静音足够长时切点不紧贴语音
+}
+
+# 大模型回复缓存配置，重复分析相同字幕时不再请求接口
+LLM_CACHE_SETTINGS = {
+    "enabled": True,
+    "db_path": os.path.join(BASE_DIR, "cache", "llm_cache.sqlite3"),
+    "ttl_days": 30,  # 缓存有效天数，0 表示永不过期
+    "max_bytes": 512 * 1024 ** 2,  # 缓存内容总大小上限，0 表示不限制
+}
+
+# 分段目录配置，所有录像的分段保存在同一个sqlite数据库中，分段编辑器和处理工具共用
+SEGMENT_CATALOG_SETTINGS = {
+    "db_path": os.path.join(BASE_DIR, "data", "segments.sqlite3"),
+    "export_json": True,  # 分析完成后是否同时导出原有格式的 <名称>_segments.json
+}
+
+# 处理进度记录，中断后重新运行时跳过已完成的分析、切割和上传
+JOB_STORE_SETTINGS = {
+    "db_path": os.path.join(BASE_DIR, "data", "jobs.sqlite3"),
+}
+
+# 处理流水线配置：分析、切割(进程数见 CUT_SETTINGS["workers"])和上传各自的并发数
+PIPELINE_SETTINGS = {
+    "recordings": 2,  # 同时分析和切割的录像数
+    "upload_workers": 1,  # 同时上传的切片数
+    "segment_queue": 8,  # 等待切割的分段数上限，达到后暂停读取大模型回复
+    "upload_queue": 4,  # 等待上传的切片数上限，达到后暂停提交新的切割任务
+}
+
+# 监视模式(main.py --watch)配置
+WATCH_SETTINGS = {
+    "use_notify": True,  # 安装了watchdog时使用inotify等系统通知，否则定时扫描
+    "poll_interval": 30,  # 定时扫描目录的间隔秒数
+    "stable_seconds": 60,  # 字幕和视频的大小在这么多秒内不再变化才认为已写完
+    "retry_interval": 600,  # 每隔这么多秒重新处理分析或上传失败的录像，0 表示不重试
 }
@@ -1,34 +1,503 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
-from typing import List, Tuple
+import shutil
+import subprocess
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from multiprocessing.util import Finalize
+from typing import AsyncIterator, Callable, List, Optional, Tuple
 
 from moviepy import VideoFileClip
 
-from config import OUTPUT_DIR
+from clip_cache import get_cache
+from config import OUTPUT_DIR, CUT_SETTINGS, CLIP_CACHE_SETTINGS, RENDITION_SETTINGS, SILENCE_SETTINGS, VIDEO_SETTINGS
+from keyframe_index import KeyframeIndex, load_index, run_ffprobe
 from logger import setup_logger
+from silence_index import SilenceIndex, load_silence_index
+from subtitle_index import SrtRangeIndex
+from timecode import parse_srt_time
 
 logger = setup_logger('video_cutter')
 
+CUT_MODES = ("encode", "copy", "smart")
+
+# 可输出的版本及其文件名后缀，landscape 即原有的切片文件
+RENDITIONS = ("landscape", "vertical", "audio")
+_RENDITION_SUFFIXES = {
+    "landscape": ".mp4",
+    "vertical": "_vertical.mp4",
+    "audio": ".m4a",
+}
+
+# 源视频编码对应的ffmpeg编码器，智能切割时用于重编码首尾GOP
+_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+
 
 def time_to_seconds(time_str: str) -> float:
     try:
-        hours, minutes, seconds = time_str.split(':')
-        seconds, milliseconds = seconds.split(',')
-        return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+        # 同时支持 HH:MM:SS,mmm 和不带毫秒的 HH:MM:SS
+        return parse_srt_time(time_str) / 1000
     except Exception as e:
         logger.error(f"时间格式转换失败: {time_str}, 错误: {str(e)}")
         raise
 
 
-def _cut(start_time: float, end_time: float, video_path: str, output_file: str) -> None:
-    video = None
-    clip = None
-    try:
-        # 检查输入文件是否存在
+def _run_ffmpeg(args: List[str]) -> None:
+    command = [CUT_SETTINGS["ffmpeg_path"], "-hide_banner", "-loglevel", "error", "-y", *args]
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg执行失败: {result.stderr.strip()}")
+
+
+def snap_to_keyframe(index: KeyframeIndex, time_point: float) -> float:
+    """将时间点对齐到最近的关键帧，搜索窗口内没有关键帧时返回原时间"""
+    keyframe = index.nearest(time_point)
+    if keyframe is None or abs(keyframe - time_point) > CUT_SETTINGS["keyframe_search_window"]:
+        logger.warning(f"{time_point:.3f}s 附近未找到关键帧: {index.video_path}")
+        return time_point
+    return keyframe
+
+
+class VideoSource:
+    """
+    源视频句柄，缓存关键帧索引和VideoFileClip读取器
+    同一任务内的所有片段共用一个句柄，探测和打开的开销只发生一次
+    """
+
+    def __init__(self, video_path: str):
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
+        self.video_path = video_path
+        stat = os.stat(video_path)
+        self._signature = (stat.st_size, stat.st_mtime_ns)
+        self._index = None
+        self._clip = None
+
+    def is_current(self) -> bool:
+        """源视频打开后是否没有被替换或改写"""
+        try:
+            stat = os.stat(self.video_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == self._signature
+
+    @property
+    def index(self) -> KeyframeIndex:
+        if self._index is None or not self._index.is_valid():
+            self._index = load_index(self.video_path)
+        return self._index
+
+    @property
+    def streams(self) -> dict:
+        return self.index.streams
+
+    @property
+    def clip(self) -> VideoFileClip:
+        if self._clip is None:
+            self._clip = VideoFileClip(self.video_path)
+        return self._clip
+
+    def close(self) -> None:
+        if self._clip is not None:
+            self._clip.close()
+            self._clip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SourceCache:
+    """
+    按路径缓存源视频句柄，任务结束时统一关闭
+    max_sources: 最多保留的句柄数，超过时关闭最久未使用的；None 或 0 表示不限制
+    源视频在打开后被替换或改写时关闭旧句柄重新打开
+    """
+
+    def __init__(self, max_sources: Optional[int] = None):
+        self.max_sources = max_sources
+        self._sources = OrderedDict()
+
+    def get(self, video_path: str) -> VideoSource:
+        key = os.path.abspath(video_path)
+        source = self._sources.get(key)
+        if source is not None and not source.is_current():
+            logger.info(f"源视频已变化，重新打开: {video_path}")
+            self._close(self._sources.pop(key))
+            source = None
+        if source is None:
+            source = VideoSource(video_path)
+            self._sources[key] = source
+            while self.max_sources and len(self._sources) > self.max_sources:
+                _, oldest = self._sources.popitem(last=False)
+                self._close(oldest)
+        self._sources.move_to_end(key)
+        return source
+
+    @staticmethod
+    def _close(source: VideoSource) -> None:
+        try:
+            source.close()
+        except Exception as e:
+            logger.warning(f"关闭视频句柄失败 {source.video_path}: {str(e)}")
+
+    def close(self) -> None:
+        for source in self._sources.values():
+            self._close(source)
+        self._sources.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _cut_copy(start_time: float, end_time: float, source: VideoSource, output_file: str) -> None:
+    """流复制切割：起点对齐到关键帧，不重新编码"""
+    video_path = source.video_path
+    if end_time <= start_time:
+        raise ValueError(f"无效的时间范围: {start_time} -> {end_time}")
+
+    if start_time < 0 or (source.index.duration and end_time > source.index.duration):
+        raise ValueError(f"时间超出视频长度: {source.index.duration}")
+
+    keyframe = snap_to_keyframe(source.index, start_time)
+    if keyframe >= end_time:
+        raise ValueError(f"对齐后的起点超出结束时间: {keyframe} -> {end_time}")
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    _run_ffmpeg([
+        "-ss", f"{keyframe:.3f}",
+        "-i", video_path,
+        "-t", f"{end_time - keyframe:.3f}",
+        "-map", "0:v:0", "-map", "0:a?",
+        "-c", "copy",
+        # 时间戳从0开始，避免播放器出现黑屏或音画不同步
+        "-avoid_negative_ts", "make_zero",
+        "-movflags", "+faststart",
+        output_file
+    ])
+    logger.info(f"视频切割完成(流复制, 起点 {start_time:.3f}s -> {keyframe:.3f}s): {output_file}")
+
+
+def _encode_args(streams: dict, threads: Optional[int] = None) -> List[str]:
+    """生成与源视频编码参数一致的重编码参数，保证各部分可以直接拼接"""
+    video = streams["video"]
+    encoder = _ENCODERS.get(video.get("codec_name"))
+    if not encoder:
+        raise ValueError(f"智能切割不支持的视频编码: {video.get('codec_name')}")
+
+    args = ["-c:v", encoder, "-preset", CUT_SETTINGS["preset"], "-crf", str(CUT_SETTINGS["crf"])]
+    if threads:
+        args += ["-threads", str(threads)]
+    if video.get("pix_fmt"):
+        args += ["-pix_fmt", video["pix_fmt"]]
+    profile = (video.get("profile") or "").lower().replace("constrained ", "")
+    if encoder == "libx264" and profile in ("baseline", "main", "high"):
+        args += ["-profile:v", profile]
+
+    audio = streams["audio"]
+    if audio:
+        args += ["-c:a", "aac"]
+        if audio.get("sample_rate"):
+            args += ["-ar", str(audio["sample_rate"])]
+        if audio.get("channels"):
+            args += ["-ac", str(audio["channels"])]
+    return args
+
+
+def _default_encode_args(threads: Optional[int] = None) -> List[str]:
+    args = ["-c:v", "libx264", "-preset", CUT_SETTINGS["preset"], "-crf", str(CUT_SETTINGS["crf"]), "-c:a", "aac"]
+    if threads:
+        args += ["-threads", str(threads)]
+    return args
+
+
+def _cut_smart(start_time: float, end_time: float, source: VideoSource, output_file: str,
+               threads: Optional[int] = None) -> None:
+    """
+    智能切割：只重编码首尾不完整的GOP，中间部分流复制，最后无损拼接
+    首部 [start_time, 第一个关键帧) 重编码，中间 [第一个关键帧, 最后一个关键帧) 流复制，
+    尾部 [最后一个关键帧, end_time) 重编码
+    """
+    video_path = source.video_path
+    if end_time <= start_time:
+        raise ValueError(f"无效的时间范围: {start_time} -> {end_time}")
+
+    streams = source.streams
+    if not streams["video"]:
+        raise ValueError(f"视频文件没有视频流: {video_path}")
+    if start_time < 0 or (streams["duration"] and end_time > streams["duration"]):
+        raise ValueError(f"时间超出视频长度: {streams['duration']}")
+
+    encode_args = _encode_args(streams, threads)
+    keyframes = source.index.between(start_time, end_time)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output_file)) as work_dir:
+        parts = []
+
+        def add_part(part_start: float, part_end: float, codec_args: List[str]) -> None:
+            if part_end - part_start <= 0.001:
+                return
+            part_file = os.path.join(work_dir, f"part{len(parts)}.ts")
+            _run_ffmpeg([
+                "-ss", f"{part_start:.3f}",
+                "-i", video_path,
+                "-t", f"{part_end - part_start:.3f}",
+                "-map", "0:v:0", "-map", "0:a?",
+                *codec_args,
+                "-f", "mpegts",
+                part_file
+            ])
+            parts.append(part_file)
+
+        if len(keyframes) < 2:
+            # 片段内关键帧不足，整段重编码
+            add_part(start_time, end_time, encode_args)
+        else:
+            head, tail = keyframes[0], keyframes[-1]
+            add_part(start_time, head, encode_args)
+            add_part(head, tail, ["-c", "copy"])
+            add_part(tail, end_time, encode_args)
+
+        list_file = os.path.join(work_dir, "parts.txt")
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for part_file in parts:
+                f.write(f"file '{part_file}'\n")
+
+        _run_ffmpeg([
+            "-f", "concat", "-safe", "0",
+            "-i", list_file,
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            output_file
+        ])
+
+    _check_duration(output_file, end_time - start_time)
+    logger.info(f"视频切割完成(智能切割, {len(parts)} 部分): {output_file}")
+
+
+def _check_duration(output_file: str, expected: float) -> None:
+    """校验输出文件的时长和首帧时间戳，偏差超过一帧左右时记录警告"""
+    output = run_ffprobe([
+        "-select_streams", "v:0",
+        "-read_intervals", "%+#1",
+        "-show_entries", "format=duration:packet=pts_time",
+        "-of", "json",
+        output_file
+    ])
+    data = json.loads(output)
+    duration = float(data.get("format", {}).get("duration") or 0)
+    packets = data.get("packets") or [{}]
+    first_pts = float(packets[0].get("pts_time") or 0)
+    if abs(duration - expected) > 0.1 or abs(first_pts) > 0.1:
+        logger.warning(f"切片时长或起始时间偏差较大: {output_file}, 期望时长 {expected:.3f}s, "
+                       f"实际时长 {duration:.3f}s, 首帧 {first_pts:.3f}s")
+
+
+def _remove_outputs(paths) -> None:
+    """
+    切割前删除旧的输出文件：旧文件可能与切片缓存中的文件是同一个硬链接，
+    ffmpeg 和 moviepy 原地覆盖时会把缓存项一起截断
+    """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def cut_segments_single_pass(video_path: str, jobs: List[Tuple[float, float, str]], mode: str = "copy",
+                             threads: Optional[int] = None) -> None:
+    """
+    单次顺序读取源视频，输出多个片段
+    片段按开始时间排序后作为同一个ffmpeg进程的多个输出，源文件只解复用(和解码)一次，
+    读取经过各片段的时间范围时写出对应文件
+    jobs: [(开始秒数, 结束秒数, 输出路径), ...]
+    mode: copy 时各片段起点对齐到关键帧并流复制，encode 时重新编码
+    """
+    if mode not in ("encode", "copy"):
+        raise ValueError(f"单次读取模式不支持的切割模式: {mode}")
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+
+    for start_time, end_time, _ in jobs:
+        if end_time <= start_time:
+            raise ValueError(f"无效的时间范围: {start_time} -> {end_time}")
+    if mode == "copy":
+        index = load_index(video_path)
+        jobs = [(snap_to_keyframe(index, start_time), end_time, output_file)
+                for start_time, end_time, output_file in jobs]
+    jobs = sorted(jobs)
+    _remove_outputs(output_file for _, _, output_file in jobs)
+
+    # 输入端只定位一次到最早的片段，之后各输出的时间相对于该位置
+    base = jobs[0][0]
+    codec_args = ["-c", "copy"] if mode == "copy" else _default_encode_args(threads)
+    # 流复制时起点正好落在关键帧上，提前1毫秒避免时间取整后丢掉关键帧
+    epsilon = 0.001 if mode == "copy" else 0
+    args = ["-ss", f"{base:.3f}", "-i", video_path]
+    for start_time, end_time, output_file in jobs:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        args += [
+            "-map", "0:v:0", "-map", "0:a?",
+            "-ss", f"{max(start_time - base - epsilon, 0):.3f}",
+            "-to", f"{end_time - base:.3f}",
+            *codec_args,
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            output_file
+        ]
+    _run_ffmpeg(args)
+    logger.info(f"单次读取切割完成({mode}, {len(jobs)} 个片段): {video_path}")
+
+
+def clip_path(video_name: str, split: dict) -> str:
+    """
+    分段的切片输出路径，标题后加上分段的起止毫秒数，
+    大模型给出重复标题时不同分段也不会写到同一个文件
+    """
+    start_ms = round(time_to_seconds(split['start_time']) * 1000)
+    end_ms = round(time_to_seconds(split['end_time']) * 1000)
+    return os.path.join(OUTPUT_DIR, video_name, f"{split['title']}_{start_ms}-{end_ms}.mp4")
+
+
+def rendition_paths(output_file: str, renditions: Tuple[str, ...] = RENDITIONS) -> dict:
+    """各版本的输出路径，landscape 即 output_file 本身"""
+    base = os.path.splitext(output_file)[0]
+    return {name: f"{base}{_RENDITION_SUFFIXES[name]}" for name in renditions}
+
+
+def _vertical_filter() -> str:
+    width, height = VIDEO_SETTINGS["width"], VIDEO_SETTINGS["height"]
+    if RENDITION_SETTINGS["vertical_fit"] == "crop":
+        return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1"
+    return (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+
 
-        # 加载视频文件
-        video = VideoFileClip(video_path)
+def _escape_filter_path(path: str) -> str:
+    """滤镜参数中的路径需要转义冒号和引号，Windows路径统一使用正斜杠"""
+    path = path.replace('\\', '/').replace(':', '\\:').replace("'", "\\'")
+    return f"'{path}'"
+
+
+def _cut_renditions(start_time: float, end_time: float, source: VideoSource, output_file: str,
+                    renditions: List[str], mode: str, threads: Optional[int] = None,
+                    subtitle_file: Optional[str] = None) -> None:
+    """
+    一次解码同时输出多个版本：横屏原版、竖屏版和纯音频共用同一个滤镜图
+    subtitle_file 为以切片起点为零点的字幕文件，在同一次编码中烧录进画面
+    mode 为 copy 且不烧录字幕时横屏版流复制，竖屏版从同一个关键帧开始编码
+    """
+    video_path = source.video_path
+    if end_time <= start_time:
+        raise ValueError(f"无效的时间范围: {start_time} -> {end_time}")
+    if start_time < 0 or (source.index.duration and end_time > source.index.duration):
+        raise ValueError(f"时间超出视频长度: {source.index.duration}")
+
+    copy_landscape = mode == "copy" and "landscape" in renditions and not subtitle_file
+    if copy_landscape:
+        start_time = snap_to_keyframe(source.index, start_time)
+
+    # 需要编码的画面先烧录字幕，横屏版和竖屏版都需要编码时再经 split 分给两路
+    encoded = [name for name in renditions
+               if name == "vertical" or (name == "landscape" and not copy_landscape)]
+    labels = {}
+    filters = []
+    video_label = "[0:v]"
+    if subtitle_file and encoded:
+        filters.append(f"[0:v]subtitles={_escape_filter_path(subtitle_file)}"
+                       f":force_style='{CUT_SETTINGS['subtitle_style']}'[subbed]")
+        video_label = labels["landscape"] = "[subbed]"
+    if len(encoded) == 2:
+        filters.append(f"{video_label}split=2[landscape][vsrc]")
+        filters.append(f"[vsrc]{_vertical_filter()}[vertical]")
+        labels["landscape"] = "[landscape]"
+        labels["vertical"] = "[vertical]"
+    elif encoded == ["vertical"]:
+        filters.append(f"{video_label}{_vertical_filter()}[vertical]")
+        labels["vertical"] = "[vertical]"
+
+    # 时长作为输入选项放在 -i 之前，限制所有输出；放在 -i 之后只对第一个输出生效
+    args = ["-ss", f"{start_time:.3f}", "-t", f"{end_time - start_time:.3f}", "-i", video_path]
+    if filters:
+        args += ["-filter_complex", ";".join(filters)]
+
+    paths = rendition_paths(output_file, tuple(renditions))
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    for name in renditions:
+        if name == "audio":
+            args += ["-map", "0:a:0", "-vn", "-c:a", "aac", "-b:a", RENDITION_SETTINGS["audio_bitrate"], paths[name]]
+            continue
+        args += ["-map", labels.get(name, "0:v:0"), "-map", "0:a?"]
+        if name == "landscape" and copy_landscape:
+            args += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+        else:
+            args += _default_encode_args(threads)
+        args += ["-movflags", "+faststart", paths[name]]
+
+    _run_ffmpeg(args)
+    logger.info(f"视频切割完成(多版本 {', '.join(renditions)}{', 烧录字幕' if subtitle_file else ''}): {output_file}")
+
+
+def cut_segment(start_time: float, end_time: float, source: VideoSource, output_file: str,
+                mode: str = "encode", threads: Optional[int] = None,
+                renditions: Optional[List[str]] = None,
+                subtitle_file: Optional[str] = None) -> Tuple[List[str], bool]:
+    """
+    按指定模式切割单个片段，流复制或智能切割失败时回退到重新编码
+    threads: 编码器线程数上限，None 表示由编码器自行决定
+    renditions: 需要输出的版本，包含横屏版以外的版本时一次解码输出全部版本
+    subtitle_file: 需要烧录的字幕文件，时间以切片起点为零点
+    返回: (实际输出的版本, 是否烧录了字幕)，多版本输出失败回退时只有不带字幕的横屏版
+    """
+    if mode not in CUT_MODES:
+        raise ValueError(f"不支持的切割模式: {mode}")
+
+    renditions = list(renditions or ["landscape"])
+    _remove_outputs(rendition_paths(output_file).values())
+    if subtitle_file or renditions != ["landscape"]:
+        try:
+            _cut_renditions(start_time, end_time, source, output_file, renditions, mode, threads, subtitle_file)
+            return renditions, bool(subtitle_file)
+        except Exception as e:
+            logger.warning(f"多版本输出或字幕烧录失败，只输出不带字幕的横屏版: {str(e)}")
+
+    if mode == "copy":
+        try:
+            _cut_copy(start_time, end_time, source, output_file)
+            return ["landscape"], False
+        except Exception as e:
+            logger.warning(f"流复制切割失败，回退到重新编码: {str(e)}")
+    elif mode == "smart":
+        try:
+            _cut_smart(start_time, end_time, source, output_file, threads)
+            return ["landscape"], False
+        except Exception as e:
+            logger.warning(f"智能切割失败，回退到重新编码: {str(e)}")
+
+    _cut(start_time, end_time, source, output_file, threads)
+    return ["landscape"], False
+
+
+def _cut(start_time: float, end_time: float, source: VideoSource, output_file: str,
+         threads: Optional[int] = None) -> None:
+    try:
+        # 复用已打开的视频文件
+        video = source.clip
 
         # 验证时间范围
         if end_time <= start_time:
@@ -36,45 +505,431 @@ def _cut(start_time: float, end_time: float, video_path: str, output_file: str)
         if start_time < 0 or end_time > video.duration:
             raise ValueError(f"时间超出视频长度: {video.duration}")
 
-        # 截取指定时间段
+        # 截取指定时间段，子片段与源视频共用读取器，不能单独关闭，由VideoSource统一释放
         clip = video.subclipped(start_time, end_time)
 
         # 确保输出目录存在
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
         # 保存输出文件
-        clip.write_videofile(output_file, logger=None)
+        clip.write_videofile(output_file, threads=threads, logger=None)
         logger.info(f"视频切割完成: {output_file}")
 
     except Exception as e:
         logger.error(f"视频切割失败: {str(e)}")
         raise
+
+
+# 工作进程内的源视频句柄缓存，每个工作进程对同一源视频只打开一次，进程退出时关闭；
+# 进程池在监视模式下长期存在，只保留最近使用的几个源视频，已处理完的录像随之关闭
+_worker_sources: Optional[SourceCache] = None
+
+
+def _init_worker() -> None:
+    global _worker_sources
+    _worker_sources = SourceCache(CUT_SETTINGS["worker_sources"])
+    Finalize(_worker_sources, _worker_sources.close, exitpriority=10)
+
+
+def _cut_worker(start_time: float, end_time: float, video_path: str, output_file: str,
+                mode: str, threads: Optional[int], renditions: Optional[List[str]],
+                subtitle_file: Optional[str]) -> Tuple[str, List[str], bool]:
+    """在工作进程中执行单个片段的切割，返回 (切片路径, 实际输出的版本, 是否烧录了字幕)"""
+    produced, subtitled = cut_segment(start_time, end_time, _worker_sources.get(video_path), output_file, mode,
+                                      threads, renditions, subtitle_file)
+    return output_file, produced, subtitled
+
+
+def create_cut_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """切割进程池，每个进程缓存打开的源视频"""
+    workers, _ = _resolve_workers(workers, None)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def _resolve_workers(workers: Optional[int], threads: Optional[int],
+                     jobs: Optional[int] = None) -> Tuple[int, int]:
+    """
+    计算并发进程数和每个进程的编码线程数，默认让所有核心都参与编码
+    jobs: 片段数，给出时进程数不超过片段数，核心按实际进程数分配
+    """
+    cpu_count = multiprocessing.cpu_count()
+    workers = workers or CUT_SETTINGS["workers"] or cpu_count
+    if jobs:
+        workers = min(workers, jobs)
+    threads = threads or CUT_SETTINGS["threads_per_worker"] or max(1, cpu_count // workers)
+    return workers, threads
+
+
+def _batches(items: list, size: int) -> List[list]:
+    if size <= 0:
+        return [items]
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _cut_profile(mode: str, single_pass: bool, rendition: str = "landscape") -> dict:
+    """影响切片内容的参数，作为切片缓存键的一部分"""
+    if rendition != "landscape":
+        profile = {"mode": mode, "rendition": rendition, "preset": CUT_SETTINGS["preset"], "crf": CUT_SETTINGS["crf"]}
+        if rendition == "vertical":
+            profile.update(width=VIDEO_SETTINGS["width"], height=VIDEO_SETTINGS["height"],
+                           fit=RENDITION_SETTINGS["vertical_fit"])
+        elif rendition == "audio":
+            profile.update(bitrate=RENDITION_SETTINGS["audio_bitrate"])
+        return profile
+    if mode == "copy":
+        return {"mode": mode}
+    if mode == "encode" and not single_pass:
+        # moviepy使用自身的默认编码参数
+        return {"mode": mode, "engine": "moviepy"}
+    return {"mode": mode, "preset": CUT_SETTINGS["preset"], "crf": CUT_SETTINGS["crf"]}
+
+
+async def _cut_video_single_pass(video_path: str, jobs: List[Tuple[str, float, float, str]], mode: str,
+                                 threads: Optional[int]):
+    """按开始时间顺序分批单次读取切割，每批完成后返回该批的切片"""
+    loop = asyncio.get_running_loop()
+    jobs = sorted(jobs, key=lambda job: job[1])
+    for batch in _batches(jobs, CUT_SETTINGS["single_pass_batch"]):
+        outputs = [(start_time, end_time, cut_path) for _, start_time, end_time, cut_path in batch]
+        try:
+            await loop.run_in_executor(None, cut_segments_single_pass, video_path, outputs, mode, threads)
+        except Exception as e:
+            # 整批失败时逐个片段重新切割
+            logger.warning(f"单次读取切割失败，改为逐个切割: {str(e)}")
+            with SourceCache() as sources:
+                for title, start_time, end_time, cut_path in batch:
+                    try:
+                        await loop.run_in_executor(None, cut_segment, start_time, end_time,
+                                                   sources.get(video_path), cut_path, mode, threads)
+                    except Exception as e:
+                        logger.error(f"片段切割失败 {title}: {str(e)}")
+                        continue
+                    yield title, cut_path
+            continue
+
+        for title, _, _, cut_path in batch:
+            yield title, cut_path
+
+
+async def _iter_jobs(jobs: List[Tuple[str, float, float, str]]):
+    for job in jobs:
+        yield job
+
+
+async def _cut_video_parallel(video_path: str, jobs: AsyncIterator[Tuple[str, float, float, str]], mode: str,
+                              workers: int, threads: Optional[int], renditions: List[str],
+                              subtitle_files: dict, prepare: Optional[Callable[[tuple], bool]] = None,
+                              executor: Optional[ProcessPoolExecutor] = None,
+                              outcomes: Optional[dict] = None):
+    """
+    在进程池中并发切割，按完成顺序返回切片
+    jobs 是异步迭代器，每到达一个任务立即提交，不必等所有任务都确定
+    prepare: 提交前对每个任务调用，返回 True 表示切片已经存在(如命中缓存)，直接返回不再切割
+    executor: 多个视频共用的进程池(见 create_cut_executor)，未指定时单独创建并在结束时关闭
+    outcomes: 记录每个切片实际输出的版本和是否烧录了字幕，切片路径 -> (版本, 是否烧录字幕)
+    """
+    # 关键帧索引在主进程建立一次并保存到视频旁边，工作进程直接读取
+    loop = asyncio.get_running_loop()
+    if mode in ("copy", "smart") or renditions != ["landscape"] or subtitle_files:
+        await loop.run_in_executor(None, load_index, video_path)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_cut_executor(workers)
+    futures = {}
+    pending = set()
+    next_job = asyncio.ensure_future(jobs.__anext__())
+    source_error = None
+    try:
+        while next_job or pending:
+            done, _ = await asyncio.wait(pending | {next_job} if next_job else pending,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_job in done:
+                done.discard(next_job)
+                try:
+                    title, start_time, end_time, cut_path = next_job.result()
+                except StopAsyncIteration:
+                    next_job = None
+                except Exception as e:
+                    # 任务来源出错时先完成已提交的切片，再抛出错误
+                    logger.error(f"获取切片任务失败: {str(e)}")
+                    source_error = e
+                    next_job = None
+                else:
+                    next_job = asyncio.ensure_future(jobs.__anext__())
+                    # 准备字幕和查询缓存需要读写文件，放到线程池中执行
+                    if prepare and await loop.run_in_executor(None, prepare,
+                                                              (title, start_time, end_time, cut_path)):
+                        yield title, cut_path
+                        continue
+                    # 提交切片任务
+                    future = loop.run_in_executor(
+                        executor, _cut_worker, start_time, end_time, video_path, cut_path, mode, threads,
+                        renditions, subtitle_files.get(cut_path)
+                    )
+                    futures[future] = title
+                    pending.add(future)
+
+            for future in done:
+                pending.discard(future)
+                title = futures[future]
+                try:
+                    cut_path, produced, subtitled = future.result()
+                except Exception as e:
+                    logger.error(f"片段切割失败 {title}: {str(e)}")
+                    continue
+                if outcomes is not None:
+                    outcomes[cut_path] = (produced, subtitled)
+                yield title, cut_path
+        if source_error:
+            raise source_error
     finally:
-        # 释放资源
-        if clip:
-            clip.close()
-        if video:
-            video.close()
+        # 提前退出时取消尚未开始的任务
+        if next_job:
+            next_job.cancel()
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _CutPlan:
+    """一个源视频的切割参数，负责把分段转换为切片任务(切点对齐静音)、准备字幕文件和查询切片缓存"""
+
+    def __init__(self, video_info: dict, mode: Optional[str], single_pass: Optional[bool],
+                 use_cache: Optional[bool], renditions: Optional[List[str]], burn_subtitles: Optional[bool],
+                 snap_to_silence: Optional[bool] = None):
+        self.mode = mode or video_info.get("cut_mode") or CUT_SETTINGS["mode"]
+        self.renditions = list(renditions or video_info.get("renditions") or RENDITION_SETTINGS["renditions"])
+        unknown = [name for name in self.renditions if name not in RENDITIONS]
+        if unknown:
+            raise ValueError(f"不支持的输出版本: {unknown}")
+        if single_pass is None:
+            single_pass = video_info.get("single_pass", CUT_SETTINGS["single_pass"])
+        if burn_subtitles is None:
+            burn_subtitles = video_info.get("burn_subtitles", CUT_SETTINGS["burn_subtitles"])
+        self.srt_path = video_info.get("srt_path") if burn_subtitles else None
+        if burn_subtitles and not self.srt_path:
+            logger.warning("未提供字幕文件，不烧录字幕")
+        if single_pass and (self.renditions != ["landscape"] or self.srt_path):
+            logger.warning("单次读取模式不支持多版本输出和字幕烧录，改为逐段切割")
+            single_pass = False
+        if single_pass and self.mode == "smart":
+            logger.warning("单次读取模式不支持智能切割，改为重新编码")
+            self.mode = "encode"
+        self.single_pass = single_pass
+        if use_cache is None:
+            use_cache = CLIP_CACHE_SETTINGS["enabled"]
+        # 同时切割的多个录像共用一份缓存清单
+        self.cache = get_cache() if use_cache else None
+        self.video_path = video_info['video_path']
+        self.video_name = video_info["video_name"]
+        os.makedirs(os.path.join(OUTPUT_DIR, self.video_name), exist_ok=True)
+        if snap_to_silence is None:
+            snap_to_silence = video_info.get("snap_to_silence", SILENCE_SETTINGS["enabled"])
+        self.snap_to_silence = snap_to_silence
+        self.silence_index: Optional[SilenceIndex] = None
+        self.srt_index = None
+        self.cut_paths = set()
+        self.subtitle_files = {}
+        self._subtitle_dir: Optional[str] = None
+        self.subtitle_digests = {}
+        self.keys = {}
+        # 切片实际输出的版本和是否烧录了字幕，回退切割时与计划不同
+        self.outcomes = {}
+
+    async def load_indexes(self) -> None:
+        loop = asyncio.get_running_loop()
+        # 整个字幕文件只建立一次索引，每个切片二分取出自己时间段内的字幕
+        if self.srt_path and self.srt_index is None:
+            self.srt_index = await loop.run_in_executor(None, SrtRangeIndex.from_file, self.srt_path)
+        # 静音索引按源视频缓存在视频旁边，只在第一次切割时分析音轨
+        if self.snap_to_silence and self.silence_index is None:
+            try:
+                self.silence_index = await loop.run_in_executor(None, load_silence_index, self.video_path)
+            except Exception as e:
+                logger.warning(f"静音索引建立失败，切点不对齐静音: {str(e)}")
+                self.snap_to_silence = False
+
+    def job(self, split: dict) -> Tuple[str, float, float, str]:
+        start_time, end_time = time_to_seconds(split['start_time']), time_to_seconds(split['end_time'])
+        if self.silence_index:
+            # 切点移到附近的静音中，避免在句子中间切断
+            snapped_start, snapped_end = self.silence_index.snap(start_time), self.silence_index.snap(end_time)
+            if snapped_end > snapped_start:
+                start_time, end_time = snapped_start, snapped_end
+        return split['title'], start_time, end_time, clip_path(self.video_name, split)
+
+    def is_new(self, job: Tuple[str, float, float, str]) -> bool:
+        """标题和起止时间都相同的分段输出到同一个切片，只切割第一个"""
+        cut_path = job[3]
+        if cut_path in self.cut_paths:
+            logger.info(f"跳过重复分段: {job[0]}")
+            return False
+        self.cut_paths.add(cut_path)
+        return True
+
+    def prepare(self, job: Tuple[str, float, float, str]) -> bool:
+        """查询缓存，所有版本都命中缓存时取出切片并返回 True；未命中时写出切片需要烧录的字幕文件"""
+        title, start_time, end_time, cut_path = job
+        srt_text = None
+        if self.srt_index:
+            srt_text = self.srt_index.render_srt(round(start_time * 1000), round(end_time * 1000))
+            if srt_text:
+                self.subtitle_digests[cut_path] = hashlib.sha256(srt_text.encode('utf-8')).hexdigest()
+
+        if self.cache and self._fetch_cached(start_time, end_time, cut_path):
+            return True
+        if srt_text:
+            self._write_subtitles(cut_path, srt_text)
+        return False
+
+    def _write_subtitles(self, cut_path: str, srt_text: str) -> None:
+        # 字幕只在切割时使用，写到临时目录，切割完成后删除，不留在输出目录中
+        if self._subtitle_dir is None:
+            self._subtitle_dir = tempfile.mkdtemp(prefix="cut_subtitles_")
+        fd, subtitle_file = tempfile.mkstemp(suffix=".srt", dir=self._subtitle_dir)
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(srt_text)
+        self.subtitle_files[cut_path] = subtitle_file
 
+    def _fetch_cached(self, start_time: float, end_time: float, cut_path: str) -> bool:
+        job_keys = {}
+        for rendition, path in rendition_paths(cut_path, tuple(self.renditions)).items():
+            profile = _cut_profile(self.mode, self.single_pass, rendition)
+            if cut_path in self.subtitle_digests and rendition != "audio":
+                profile.update(subtitles=self.subtitle_digests[cut_path], style=CUT_SETTINGS["subtitle_style"])
+            job_keys[path] = self.cache.make_key(self.video_path, start_time, end_time, profile)
+        if all(self.cache.lookup(key) for key in job_keys.values()) and \
+                all(self.cache.fetch(key, path) for path, key in job_keys.items()):
+            return True
+        self.keys[cut_path] = job_keys
+        return False
 
-async def cut_video(video_info: dict):
+    def store(self, title: str, cut_path: str) -> None:
+        subtitle_file = self.subtitle_files.pop(cut_path, None)
+        if subtitle_file:
+            with suppress(OSError):
+                os.remove(subtitle_file)
+        # 命中缓存的切片没有需要写入的键
+        job_keys = self.keys.pop(cut_path, None)
+        outcome = self.outcomes.pop(cut_path, None)
+        if not self.cache or not job_keys:
+            return
+        if outcome:
+            # 只缓存实际输出的版本；字幕烧录失败时带字幕的键不能指向不带字幕的切片
+            produced, subtitled = outcome
+            if cut_path in self.subtitle_digests and not subtitled:
+                produced = [name for name in produced if name == "audio"]
+                logger.warning(f"字幕没有烧录，切片不写入缓存: {title}")
+            produced_paths = set(rendition_paths(cut_path, tuple(produced)).values())
+            job_keys = {path: key for path, key in job_keys.items() if path in produced_paths}
+        try:
+            for path, key in job_keys.items():
+                self.cache.store(key, path, {"source": self.video_path, "title": title})
+        except Exception as e:
+            logger.warning(f"切片写入缓存失败 {title}: {str(e)}")
+
+    def close(self) -> None:
+        """删除切割失败或被丢弃的切片留下的字幕文件"""
+        if self._subtitle_dir:
+            shutil.rmtree(self._subtitle_dir, ignore_errors=True)
+            self._subtitle_dir = None
+
+
+async def cut_video(video_info: dict, mode: Optional[str] = None,
+                    workers: Optional[int] = None, threads: Optional[int] = None,
+                    single_pass: Optional[bool] = None, use_cache: Optional[bool] = None,
+                    renditions: Optional[List[str]] = None, burn_subtitles: Optional[bool] = None,
+                    snap_to_silence: Optional[bool] = None):
+    """
+    在进程池中并发切割视频，按完成顺序返回切片信息
+    mode: 切割模式，未指定时依次使用 video_info["cut_mode"] 和配置中的默认值
+    workers: 并发切割的进程数，未指定时使用配置或CPU核心数
+    threads: 每个进程的编码线程数，未指定时按CPU核心数平均分配
+    single_pass: 是否一次顺序读取源视频输出所有片段，未指定时依次使用 video_info["single_pass"] 和配置
+    use_cache: 是否使用切片缓存跳过已切好的片段，未指定时使用配置
+    renditions: 需要输出的版本，未指定时依次使用 video_info["renditions"] 和配置，
+                其他版本的路径可以用 rendition_paths(切片路径) 得到
+    burn_subtitles: 是否把 video_info["srt_path"] 中对应时间段的字幕烧录进画面，未指定时依次使用
+                    video_info["burn_subtitles"] 和配置
+    snap_to_silence: 是否把切点对齐到附近的静音，未指定时依次使用 video_info["snap_to_silence"] 和配置
+    返回: [(标题, 切片路径), ...]
+    """
+    plan = _CutPlan(video_info, mode, single_pass, use_cache, renditions, burn_subtitles, snap_to_silence)
+    try:
+        await plan.load_indexes()
+
+        # 已经切过的片段直接从缓存取出，所有版本都命中才算命中
+        loop = asyncio.get_running_loop()
+        jobs = []
+        for job in (plan.job(split) for split in video_info["segments"]):
+            if not plan.is_new(job):
+                continue
+            if await loop.run_in_executor(None, plan.prepare, job):
+                yield job[0], job[3]
+                continue
+            jobs.append(job)
+
+        if not jobs:
+            return
+        workers, threads = _resolve_workers(workers, threads, len(jobs))
+
+        if plan.single_pass:
+            # 顺序读取时编码线程不再分给多个进程
+            results = _cut_video_single_pass(plan.video_path, jobs, plan.mode, threads * workers)
+        else:
+            results = _cut_video_parallel(plan.video_path, _iter_jobs(jobs), plan.mode, workers, threads,
+                                          plan.renditions, plan.subtitle_files, outcomes=plan.outcomes)
+
+        try:
+            async for title, cut_path in results:
+                # 写入缓存会复制文件和改写清单，放到线程池中执行
+                await loop.run_in_executor(None, plan.store, title, cut_path)
+                yield title, cut_path
+        finally:
+            await results.aclose()
+    finally:
+        plan.close()
+
+
+async def cut_video_stream(video_info: dict, segments: AsyncIterator[dict], mode: Optional[str] = None,
+                           workers: Optional[int] = None, threads: Optional[int] = None,
+                           use_cache: Optional[bool] = None, renditions: Optional[List[str]] = None,
+                           burn_subtitles: Optional[bool] = None, snap_to_silence: Optional[bool] = None,
+                           executor: Optional[ProcessPoolExecutor] = None):
     """
-    切割视频并返回切片信息列表
+    边接收分段边切割：每到达一个分段立即提交到进程池，按完成顺序返回切片信息
+    video_info 中不需要 segments，其他参数与 cut_video 相同；
+    分段总数未知，不支持单次读取模式
+    executor: 同时处理多个视频时共用的切割进程池
     返回: [(标题, 切片路径), ...]
     """
-    video_path = video_info['video_path']
-    name = video_info["video_name"]
-    output_path = os.path.join(OUTPUT_DIR, name)
-    os.makedirs(output_path, exist_ok=True)
-
-    for split in video_info["segments"]:
-        title = split['title']
-        start_time = split['start_time']
-        end_time = split['end_time']
-        cut_path = os.path.join(output_path, f"{title}.mp4")
-        # 提交切片任务
-        _cut(time_to_seconds(start_time), time_to_seconds(end_time), video_path,
-             cut_path)
-        yield title, cut_path
+    if video_info.get("single_pass", CUT_SETTINGS["single_pass"]):
+        logger.warning("边分析边切割时分段陆续到达，不使用单次读取模式，改为逐段切割")
+    plan = _CutPlan(video_info, mode, False, use_cache, renditions, burn_subtitles, snap_to_silence)
+    await plan.load_indexes()
+    loop = asyncio.get_running_loop()
+    if plan.srt_path:
+        # 字幕文件随分段到达才写出，提前建立烧录字幕需要的关键帧索引
+        await loop.run_in_executor(None, load_index, plan.video_path)
+    workers, threads = _resolve_workers(workers, threads)
+
+    async def jobs():
+        async for split in segments:
+            job = plan.job(split)
+            if plan.is_new(job):
+                yield job
+
+    results = _cut_video_parallel(plan.video_path, jobs(), plan.mode, workers, threads,
+                                  plan.renditions, plan.subtitle_files, plan.prepare, executor, plan.outcomes)
+    try:
+        async for title, cut_path in results:
+            # 写入缓存会复制文件和改写清单，放到线程池中执行
+            await loop.run_in_executor(None, plan.store, title, cut_path)
+            yield title, cut_path
+    finally:
+        await results.aclose()
+        plan.close()
 
 # cut_video(json.load(open("20250315-150234-278-升哥下午茶_segments.json", "r", encoding="utf-8")))
@@ -0,0 +1,116 @@
+import os
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from logger import setup_logger
+
+logger = setup_logger('danmaku')
+
+# 每累计这么多条弹幕合并一次直方图
+_BATCH_SIZE = 65536
+
+
+def danmaku_path_for(srt_file: str) -> Optional[str]:
+    """录播姬等工具把弹幕保存为与录像同名的 .xml 文件"""
+    path = f"{os.path.splitext(srt_file)[0]}.xml"
+    return path if os.path.exists(path) else None
+
+
+def iter_danmaku_times(xml_file: str) -> Iterator[float]:
+    """
+    逐条读取弹幕XML中 <d p="时间,..."> 的出现时间(秒)，已处理的元素立即释放，内存占用与文件大小无关
+    录制中断导致XML不完整时，返回已经读到的部分
+    """
+    root = None
+    try:
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == 'd':
+                p = elem.get('p', '')
+                try:
+                    yield float(p.split(',', 1)[0])
+                except ValueError:
+                    pass
+            if elem is not root:
+                elem.clear()
+                root.clear()
+    except ET.ParseError as e:
+        logger.warning(f"弹幕文件不完整，只使用已读取的部分: {xml_file}, 错误: {str(e)}")
+
+
+class DanmakuDensity:
+    """按秒统计的弹幕数量直方图，用于找出弹幕密集(通常也是内容精彩)的时间段"""
+
+    def __init__(self, counts: np.ndarray):
+        self.counts = counts
+        # 前缀和，任意时间段的弹幕数 O(1) 得到
+        self.cumulative = np.concatenate(([0], np.cumsum(counts)))
+
+    @property
+    def total(self) -> int:
+        return int(self.cumulative[-1])
+
+    @classmethod
+    def from_file(cls, xml_file: str) -> "DanmakuDensity":
+        counts = np.zeros(0, dtype=np.int64)
+        batch = array('d')
+
+        def flush() -> None:
+            nonlocal counts
+            if not batch:
+                return
+            seconds = np.array(batch, dtype=np.float64)
+            binned = np.bincount(seconds[seconds >= 0].astype(np.int64))
+            if len(binned) > len(counts):
+                counts = np.pad(counts, (0, len(binned) - len(counts)))
+            counts[:len(binned)] += binned
+            del batch[:]
+
+        for time_point in iter_danmaku_times(xml_file):
+            batch.append(time_point)
+            if len(batch) >= _BATCH_SIZE:
+                flush()
+        flush()
+        density = cls(counts)
+        logger.info(f"弹幕密度统计完成: {xml_file}, 共 {density.total} 条弹幕, 时长 {len(counts)}s")
+        return density
+
+    def count_between(self, start_ms: int, end_ms: int) -> int:
+        last = len(self.counts)
+        start = min(max(start_ms // 1000, 0), last)
+        end = min(max(-(-end_ms // 1000), start), last)
+        return int(self.cumulative[end] - self.cumulative[start])
+
+    def score(self, start_ms: int, end_ms: int) -> float:
+        """时间段内平均每分钟的弹幕数"""
+        duration = max(end_ms - start_ms, 1)
+        return self.count_between(start_ms, end_ms) * 60000 / duration
+
+    def window_counts(self, window_seconds: int) -> np.ndarray:
+        """把直方图按固定窗口分组，返回每个窗口的弹幕数"""
+        windows = -(-len(self.counts) // window_seconds)
+        padded = np.pad(self.counts, (0, windows * window_seconds - len(self.counts)))
+        return padded.reshape(windows, window_seconds).sum(axis=1)
+
+    def top_spans(self, window_seconds: int, top_ratio: float) -> List[Tuple[int, int]]:
+        """
+        弹幕数排在前 top_ratio 的窗口，相邻窗口合并，返回按时间排序的 (开始毫秒, 结束毫秒)
+        """
+        totals = self.window_counts(window_seconds)
+        if not len(totals) or not totals.any():
+            return []
+        keep = max(1, int(np.ceil(len(totals) * top_ratio)))
+        selected = np.zeros(len(totals), dtype=bool)
+        selected[np.argsort(totals, kind='stable')[::-1][:keep]] = True
+        selected &= totals > 0
+
+        # 选中状态变化的位置即为时间段的起止窗口
+        changes = np.flatnonzero(np.diff(np.concatenate(([False], selected, [False])).astype(np.int8)))
+        return [(int(start) * window_seconds * 1000, int(end) * window_seconds * 1000)
+                for start, end in zip(changes[::2], changes[1::2])]
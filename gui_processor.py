@@ -1,11 +1,11 @@
 import asyncio
-import json
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-from cuter import cut_video
+from cuter import clip_path, cut_video
 from logger import setup_logger
+from segment_catalog import STATUS_FAILED, STATUS_UPLOADED, SegmentCatalog
 from uploader import upload
 
 logger = setup_logger('gui_processor')
@@ -17,7 +17,8 @@ class ProcessorGUI:
         self.root.title("视频切片处理工具")
         self.root.geometry("800x600")
 
-        self.json_path = None
+        self.catalog = SegmentCatalog()
+        self.video_name = None
         self.video_path = None
         self.segments_data = None
 
@@ -34,11 +35,14 @@ class ProcessorGUI:
         file_frame = ttk.LabelFrame(self.root, text="文件选择")
         file_frame.pack(fill='x', padx=10, pady=5)
 
-        # JSON文件选择
-        ttk.Label(file_frame, text="分段JSON:").grid(row=0, column=0, padx=5, pady=5)
-        self.json_label = ttk.Label(file_frame, text="未选择")
-        self.json_label.grid(row=0, column=1, padx=5, pady=5)
-        ttk.Button(file_frame, text="选择JSON", command=self.select_json).grid(row=0, column=2, padx=5, pady=5)
+        # 从分段目录选择录像，或导入JSON
+        ttk.Label(file_frame, text="分段:").grid(row=0, column=0, padx=5, pady=5)
+        self.video_name_var = tk.StringVar()
+        self.video_combo = ttk.Combobox(file_frame, textvariable=self.video_name_var, state='readonly', width=40,
+                                        postcommand=self.refresh_videos)
+        self.video_combo.grid(row=0, column=1, padx=5, pady=5)
+        self.video_combo.bind('<<ComboboxSelected>>', lambda _: self.load_segments(self.video_name_var.get()))
+        ttk.Button(file_frame, text="导入JSON", command=self.select_json).grid(row=0, column=2, padx=5, pady=5)
 
         # 视频文件选择
         ttk.Label(file_frame, text="视频文件:").grid(row=1, column=0, padx=5, pady=5)
@@ -78,9 +82,15 @@ class ProcessorGUI:
             initialdir=os.getcwd()
         )
         if file_path:
-            self.json_path = file_path
-            self.json_label.config(text=os.path.basename(file_path))
-            self.load_segments()
+            try:
+                video_name, _ = self.catalog.import_json(file_path)
+            except Exception as e:
+                messagebox.showerror("错误", f"导入JSON失败: {str(e)}")
+                return
+            self.load_segments(video_name)
+
+    def refresh_videos(self):
+        self.video_combo['values'] = [video['name'] for video in self.catalog.videos()]
 
     def select_video(self):
         file_path = filedialog.askopenfilename(
@@ -101,10 +111,15 @@ class ProcessorGUI:
             self.video_path = file_path
             self.video_label.config(text=os.path.basename(file_path))
 
-    def load_segments(self):
+    def load_segments(self, video_name):
         try:
-            with open(self.json_path, 'r', encoding='utf-8') as f:
-                self.segments_data = json.load(f)
+            self.video_name = video_name
+            self.video_name_var.set(video_name)
+            self.segments_data = self.catalog.video_info(video_name)
+            # 目录中记录了视频路径时不必再手动选择
+            if not self.video_path and self.segments_data.get("video_path"):
+                self.video_path = self.segments_data["video_path"]
+                self.video_label.config(text=os.path.basename(self.video_path))
 
             # 清空现有列表
             for item in self.segments_tree.get_children():
@@ -119,22 +134,37 @@ class ProcessorGUI:
                         segment['title']
                     ))
         except Exception as e:
-            messagebox.showerror("错误", f"加载JSON失败: {str(e)}")
+            messagebox.showerror("错误", f"加载分段失败: {str(e)}")
 
     async def process_video(self):
         try:
-            if not self.json_path or not self.video_path:
-                messagebox.showwarning("警告", "请先选择JSON文件和视频文件")
+            if not self.video_name or not self.video_path:
+                messagebox.showwarning("警告", "请先选择分段和视频文件")
                 return
 
+            # 重新读取分段，包含在分段编辑器中的修改
+            self.segments_data = self.catalog.video_info(self.video_name)
+            self.segments_data["video_path"] = self.video_path
+            # 切片路径对每个分段唯一，标题可能重复
+            segment_ids = {clip_path(self.video_name, segment): segment['id']
+                           for segment in self.catalog.segments(self.video_name)}
+
             # 执行切片
             async for title, cut_path in await self.root.async_call(cut_video, self.segments_data):
-                # 上传切片
+                # 上传切片，结果记录在分段目录中
                 try:
-                    await self.root.async_call(upload, title, cut_path)
-                    logger.info(f"上传完成: {title}")
+                    upload_id = await upload(title, cut_path)
+                    if upload_id:
+                        status = STATUS_UPLOADED
+                        logger.info(f"上传完成: {title} {upload_id}")
+                    else:
+                        status = STATUS_FAILED
+                        logger.error(f"上传失败 {title}: 没有得到稿件BV号")
                 except Exception as e:
+                    status = STATUS_FAILED
                     logger.error(f"上传失败 {title}: {str(e)}")
+                if cut_path in segment_ids:
+                    self.catalog.update(segment_ids[cut_path], status=status)
 
             messagebox.showinfo("完成", "所有任务处理完成")
         except Exception as e:
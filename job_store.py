@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import JOB_STORE_SETTINGS
+from logger import setup_logger
+
+logger = setup_logger('job_store')
+
+# 录像的处理阶段
+RECORDING_PENDING = "pending"
+RECORDING_ANALYZED = "analyzed"
+RECORDING_DONE = "done"
+
+# 分段的处理阶段，按先后顺序排列
+SEGMENT_PENDING = "pending"
+SEGMENT_CUT = "cut"
+SEGMENT_COVER = "cover"
+SEGMENT_UPLOADED = "uploaded"
+SEGMENT_STAGES = (SEGMENT_PENDING, SEGMENT_CUT, SEGMENT_COVER, SEGMENT_UPLOADED)
+
+
+def segment_key(start_time: str, end_time: str) -> str:
+    """分段在录像内的唯一标识，同一段时间重新分析后标识不变"""
+    return f"{start_time}-{end_time}"
+
+
+def split_segment_key(key: str) -> Tuple[str, str]:
+    """segment_key 的逆操作，返回 (开始时间, 结束时间)"""
+    start_time, _, end_time = key.partition("-")
+    return start_time, end_time
+
+
+class JobStore:
+    """
+    处理进度的持久化记录：每个录像记录是否已分析完成，每个分段记录已切割、已生成封面、已上传及投稿ID
+    每次状态变化都是单独提交的事务，进程中断后重启只处理未完成的部分
+    字幕文件的大小或修改时间变化后，该录像重新分析，未上传分段的记录作废；
+    已上传的分段保留投稿ID，重新分析给出相同时间段时不会重复投稿
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or JOB_STORE_SETTINGS["db_path"]
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    name TEXT PRIMARY KEY,
+                    srt_path TEXT NOT NULL,
+                    srt_size INTEGER NOT NULL,
+                    srt_mtime_ns INTEGER NOT NULL,
+                    stage TEXT NOT NULL,
+                    error TEXT,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS segment_jobs (
+                    recording TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    cut_path TEXT,
+                    cover_path TEXT,
+                    upload_id TEXT,
+                    error TEXT,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (recording, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_segment_jobs_stage ON segment_jobs (recording, stage)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可以在多个线程中同时使用
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # 每次提交都落盘，断电后也不会丢失已完成的状态
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def open_recording(self, name: str, srt_path: str) -> str:
+        """
+        开始处理录像，返回录像当前所处的阶段
+        首次处理或字幕文件已变化时重置为 pending，并清除该录像尚未上传的分段记录
+        """
+        stat = os.stat(srt_path)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT srt_size, srt_mtime_ns, stage FROM recordings WHERE name = ?",
+                               (name,)).fetchone()
+            if row and row["srt_size"] == stat.st_size and row["srt_mtime_ns"] == stat.st_mtime_ns:
+                return row["stage"]
+            if row:
+                logger.info(f"字幕文件已变化，重新处理: {srt_path}")
+            conn.execute("DELETE FROM segment_jobs WHERE recording = ? AND stage != ?", (name, SEGMENT_UPLOADED))
+            conn.execute("INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                         (name, srt_path, stat.st_size, stat.st_mtime_ns, RECORDING_PENDING, now))
+        return RECORDING_PENDING
+
+    def set_recording_stage(self, name: str, stage: str, error: Optional[str] = None) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE recordings SET stage = ?, error = ?, updated = ? WHERE name = ?",
+                         (stage, error, time.time(), name))
+
+    def reset(self, name: str) -> None:
+        """删除录像的所有记录，下次从头处理"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM segment_jobs WHERE recording = ?", (name,))
+            conn.execute("DELETE FROM recordings WHERE name = ?", (name,))
+
+    def unfinished_recordings(self) -> Dict[str, str]:
+        """尚未处理完成的录像，录像名 -> 字幕路径"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, srt_path FROM recordings WHERE stage != ?", (RECORDING_DONE,))
+            return {row["name"]: row["srt_path"] for row in rows}
+
+    def add_segment(self, recording: str, key: str, title: str) -> str:
+        """记录新分段，已存在时保留原有进度；返回分段当前所处的阶段"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                INSERT INTO segment_jobs (recording, key, title, stage, updated) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (recording, key) DO UPDATE SET title = excluded.title
+                WHERE stage = ?
+            """, (recording, key, title, SEGMENT_PENDING, time.time(), SEGMENT_PENDING))
+            return conn.execute("SELECT stage FROM segment_jobs WHERE recording = ? AND key = ?",
+                                (recording, key)).fetchone()["stage"]
+
+    def update_segment(self, recording: str, key: str, stage: str, **fields) -> None:
+        """推进分段的阶段，同时记录切片路径、封面路径、投稿ID或错误信息"""
+        if stage not in SEGMENT_STAGES:
+            raise ValueError(f"未知的分段阶段: {stage}")
+        unknown = set(fields) - {"cut_path", "cover_path", "upload_id", "error"}
+        if unknown:
+            raise ValueError(f"不支持记录的字段: {', '.join(sorted(unknown))}")
+        columns = {"stage": stage, **fields, "updated": time.time()}
+        if "error" not in fields:
+            columns["error"] = None
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE segment_jobs SET {assignments} WHERE recording = ? AND key = ?",
+                         (*columns.values(), recording, key))
+
+    def record_error(self, recording: str, key: str, error: str) -> None:
+        """记录失败原因，阶段不变，下次运行时重试"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE segment_jobs SET error = ?, updated = ? WHERE recording = ? AND key = ?",
+                         (error, time.time(), recording, key))
+
+    def segments(self, recording: str, stages: Optional[List[str]] = None) -> Dict[str, dict]:
+        """录像的分段记录，以分段标识为键；stages 指定时只返回处于这些阶段的分段"""
+        query = "SELECT * FROM segment_jobs WHERE recording = ?"
+        params = [recording]
+        if stages:
+            query += f" AND stage IN ({', '.join('?' * len(stages))})"
+            params.extend(stages)
+        with closing(self._connect()) as conn:
+            return {row["key"]: dict(row) for row in conn.execute(query, params)}
+
+    def unfinished(self, recording: str, keys: Iterable[str]) -> List[str]:
+        """给定分段中尚未上传的分段标识"""
+        jobs = self.segments(recording)
+        return [key for key in keys if jobs.get(key, {}).get("stage") != SEGMENT_UPLOADED]
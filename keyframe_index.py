@@ -0,0 +1,150 @@
+import json
+import os
+import subprocess
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from config import CUT_SETTINGS
+from logger import setup_logger
+from sidecar import is_current, load_or_build, load_sidecar, save_sidecar
+
+logger = setup_logger('keyframe_index')
+
+# 索引文件格式版本，格式变化时递增使旧索引失效
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".kfi"
+
+
+def run_ffprobe(args: List[str]) -> str:
+    command = [CUT_SETTINGS["ffprobe_path"], "-v", "error", *args]
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe执行失败: {result.stderr.strip()}")
+    return result.stdout
+
+
+def probe_streams(video_path: str) -> dict:
+    """读取容器时长及首个视频流、音频流的编码参数"""
+    output = run_ffprobe([
+        "-show_entries",
+        "format=duration:stream=codec_type,codec_name,profile,pix_fmt,width,height,sample_rate,channels",
+        "-of", "json",
+        video_path
+    ])
+    data = json.loads(output)
+    info = {"duration": float(data.get("format", {}).get("duration") or 0), "video": None, "audio": None}
+    for stream in data.get("streams", []):
+        codec_type = stream.get("codec_type")
+        if codec_type in ("video", "audio") and info[codec_type] is None:
+            info[codec_type] = stream
+    return info
+
+
+class KeyframeIndex:
+    """
+    源视频的关键帧索引：关键帧时间戳和字节偏移按时间升序存放在数组中，查找均为二分
+    索引以 <视频文件名>.kfi 的形式保存在视频旁边，视频大小或修改时间变化后自动失效
+    """
+
+    def __init__(self, video_path: str, size: int, mtime_ns: int, streams: dict,
+                 times: array, offsets: array):
+        self.video_path = video_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.streams = streams
+        self.times = times
+        self.offsets = offsets
+
+    @property
+    def duration(self) -> float:
+        return self.streams["duration"]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @classmethod
+    def build(cls, video_path: str) -> "KeyframeIndex":
+        """完整扫描一次视频流的包头（不解码）建立索引"""
+        stat = os.stat(video_path)
+        streams = probe_streams(video_path)
+        times = array('d')
+        offsets = array('q')
+
+        command = [
+            CUT_SETTINGS["ffprobe_path"], "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,pos,flags",
+            "-of", "csv=p=0",
+            video_path
+        ]
+        # 错误输出写到临时文件，损坏的视频输出大量错误时不会因管道写满而卡住
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr,
+                                       text=True, encoding='utf-8', errors='replace')
+            try:
+                # 逐行读取，内存占用只和关键帧数量有关
+                for line in process.stdout:
+                    fields = line.strip().split(',')
+                    if len(fields) < 3 or 'K' not in fields[2] or fields[0] in ('', 'N/A'):
+                        continue
+                    times.append(float(fields[0]))
+                    offsets.append(int(fields[1]) if fields[1] not in ('', 'N/A') else -1)
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f"ffprobe执行失败: {stderr.read().decode('utf-8', errors='replace').strip()}")
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        # B帧等情况下包的顺序不一定按时间递增
+        if any(times[i] > times[i + 1] for i in range(len(times) - 1)):
+            pairs = sorted(zip(times, offsets))
+            times = array('d', (t for t, _ in pairs))
+            offsets = array('q', (o for _, o in pairs))
+
+        logger.info(f"关键帧索引建立完成: {video_path}, 共 {len(times)} 个关键帧")
+        return cls(video_path, stat.st_size, stat.st_mtime_ns, streams, times, offsets)
+
+    def is_valid(self) -> bool:
+        return is_current(self.video_path, self.size, self.mtime_ns)
+
+    def save(self, index_path: str) -> None:
+        save_sidecar(index_path, INDEX_VERSION, self.size, self.mtime_ns, {"streams": self.streams},
+                     [self.times, self.offsets])
+
+    @classmethod
+    def load(cls, video_path: str, index_path: str) -> "KeyframeIndex":
+        header, (times, offsets) = load_sidecar(index_path, INDEX_VERSION, 'dq')
+        return cls(video_path, header["size"], header["mtime_ns"], header["streams"], times, offsets)
+
+    def floor(self, time_point: float) -> Optional[float]:
+        """不晚于指定时间的最后一个关键帧"""
+        i = bisect_right(self.times, time_point)
+        return self.times[i - 1] if i else None
+
+    def ceil(self, time_point: float) -> Optional[float]:
+        """不早于指定时间的第一个关键帧"""
+        i = bisect_left(self.times, time_point)
+        return self.times[i] if i < len(self.times) else None
+
+    def nearest(self, time_point: float) -> Optional[float]:
+        candidates = [k for k in (self.floor(time_point), self.ceil(time_point)) if k is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda k: abs(k - time_point))
+
+    def between(self, start: float, end: float) -> List[float]:
+        """闭区间 [start, end] 内的所有关键帧"""
+        return list(self.times[bisect_left(self.times, start):bisect_right(self.times, end)])
+
+
+def index_path_for(video_path: str) -> str:
+    return f"{video_path}{INDEX_SUFFIX}"
+
+
+def load_index(video_path: str, rebuild: bool = False) -> KeyframeIndex:
+    """读取视频旁边的关键帧索引，索引不存在、损坏或已过期时重新扫描并保存"""
+    return load_or_build(KeyframeIndex, video_path, index_path_for(video_path), "关键帧索引", rebuild)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional, Tuple
+
+from config import LLM_CACHE_SETTINGS
+from logger import setup_logger
+
+logger = setup_logger('llm_cache')
+
+
+class ResponseCache:
+    """
+    大模型回复的磁盘缓存，以模型、完整提示词和提示词版本的哈希为键，
+    保存思考过程、回复内容和用量；支持过期时间和总大小上限
+    """
+
+    def __init__(self, db_path: Optional[str] = None, ttl_days: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.db_path = db_path or LLM_CACHE_SETTINGS["db_path"]
+        ttl_days = LLM_CACHE_SETTINGS["ttl_days"] if ttl_days is None else ttl_days
+        self.ttl = ttl_days * 86400
+        self.max_bytes = LLM_CACHE_SETTINGS["max_bytes"] if max_bytes is None else max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    reasoning_content TEXT NOT NULL,
+                    answer_content TEXT NOT NULL,
+                    usage TEXT,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可以在多个线程中同时使用
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(model: str, messages: list, prompt_version: str) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "prompt_version": prompt_version},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, Optional[dict]]]:
+        """返回 (思考过程, 回复内容, 用量)，未命中或已过期时返回 None"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT reasoning_content, answer_content, usage, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            reasoning_content, answer_content, usage, created = row
+            if self.ttl > 0 and now - created > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return reasoning_content, answer_content, json.loads(usage) if usage else None
+
+    def put(self, key: str, model: str, prompt_version: str, reasoning_content: str, answer_content: str,
+            usage: Optional[dict] = None) -> None:
+        now = time.time()
+        size = len(reasoning_content.encode('utf-8')) + len(answer_content.encode('utf-8'))
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, prompt_version, reasoning_content, answer_content,
+                 json.dumps(usage) if usage else None, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """删除过期项，总大小超过上限时按最近使用时间从旧到新删除"""
+        if self.ttl > 0:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        if self.max_bytes <= 0:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+        logger.info(f"回复缓存已淘汰至 {total} 字节")
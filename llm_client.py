@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import QWEN_CONFIG
+from logger import setup_logger
+
+logger = setup_logger('llm_client')
+
+# 进程内共享的客户端，所有分析请求复用同一个连接池，避免每次都重新建立连接和TLS握手
+_async_client: Optional[AsyncOpenAI] = None
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=QWEN_CONFIG["max_connections"],
+        max_keepalive_connections=QWEN_CONFIG["max_connections"],
+        keepalive_expiry=QWEN_CONFIG["keepalive_expiry"],
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    # 流式回复可能持续数分钟，只限制连接时间和两次数据之间的间隔
+    return httpx.Timeout(QWEN_CONFIG["read_timeout"], connect=10.0)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    获取共享的异步客户端
+    连接池绑定在创建它的事件循环上，事件循环变化时重新创建
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if _async_client is None or _async_loop is not loop:
+            if _async_client is not None:
+                logger.warning("事件循环已变化，重新创建异步客户端")
+                _discard(_async_client, _async_loop)
+            _async_client = AsyncOpenAI(
+                api_key=QWEN_CONFIG["api_key"],
+                base_url=QWEN_CONFIG["base_url"],
+                # 重试和限流由 AnalysisRunner 统一处理，SDK内部的重试会绕过限流
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            )
+            _async_loop = loop
+        return _async_client
+
+
+def _discard(client: AsyncOpenAI, loop: asyncio.AbstractEventLoop) -> None:
+    """在客户端所属的事件循环中关闭它的连接池，事件循环已关闭时连接随之失效"""
+    if not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+
+
+async def aclose_clients() -> None:
+    """关闭共享客户端的连接池，在程序或任务结束时调用"""
+    global _async_client, _async_loop
+    with _lock:
+        async_client, async_loop = _async_client, _async_loop
+        _async_client = _async_loop = None
+    if async_client is None:
+        return
+    if async_loop is asyncio.get_running_loop():
+        await async_client.close()
+    else:
+        _discard(async_client, async_loop)
@@ -0,0 +1,232 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+from logger import setup_logger
+
+logger = setup_logger('llm_stub')
+
+# 分析请求中的字幕时间：普通模式 [HH:MM:SS,mmm --> HH:MM:SS,mmm]，紧凑模式 [+12.34 --> +15.06]
+_SRT_TIME = re.compile(r"\[(\d+:\d{2}:\d{2},\d{3}) --> (\d+:\d{2}:\d{2},\d{3})\]")
+_COMPACT_TIME = re.compile(r"\[([+-]\d+(?:\.\d+)?) --> ([+-]\d+(?:\.\d+)?)\]")
+
+
+class StubStats:
+    """本地模拟服务收到的请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self.completion_chars = 0
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    def record(self, prompt: str, completion_chars: int = 0, error: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += len(prompt)
+            self.completion_chars += completion_chars
+            self.prompts.append(prompt)
+            if error:
+                self.errors += 1
+
+
+class StubLLMServer:
+    """
+    模拟 OpenAI 兼容的 chat.completions 流式接口，用于离线测试分析流程
+    tokens_per_second: 每秒返回的token数，0 表示不限速
+    reasoning_tokens: 回复前先返回的思考过程token数
+    segments_per_request: 每次回复按请求中的字幕时间均分出的分段数
+    error_rate: 请求直接返回错误的概率，error_status 为返回的HTTP状态码
+    chars_per_token: 每个流式增量的字符数
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, tokens_per_second: float = 0,
+                 reasoning_tokens: int = 0, segments_per_request: int = 3, error_rate: float = 0.0,
+                 error_status: int = 429, chars_per_token: int = 2, seed: Optional[int] = None):
+        self.tokens_per_second = tokens_per_second
+        self.reasoning_tokens = reasoning_tokens
+        self.segments_per_request = segments_per_request
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chars_per_token = chars_per_token
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.stats = StubStats()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"模拟大模型服务已启动: {self.base_url}")
+        return self
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行，直到被中断"""
+        logger.info(f"模拟大模型服务已启动: {self.base_url}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _should_fail(self) -> bool:
+        with self._random_lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def build_answer(self, prompt: str) -> str:
+        """按请求中字幕的时间范围均分出若干分段，格式与系统提示词要求的一致"""
+        spans: List[Tuple[str, str]] = _SRT_TIME.findall(prompt)
+        if not spans:
+            spans = _COMPACT_TIME.findall(prompt)
+        if not spans:
+            return "未找到字幕内容"
+
+        count = max(1, min(self.segments_per_request, len(spans)))
+        step = len(spans) / count
+        blocks = []
+        for i in range(count):
+            first, last = spans[int(i * step)], spans[int((i + 1) * step) - 1]
+            blocks.append(f"分段{i + 1}：\n- 时间：[{first[0]}] --> [{last[1]}]\n"
+                          f"- 标题：模拟分段{i + 1}\n- 内容概要：模拟服务生成的第{i + 1}个分段")
+        return "\n\n".join(blocks) + "\n"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_event(self, payload) -> None:
+                data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+                chunk = f"data: {data}\n\n".encode('utf-8')
+                # 分块传输，每个事件立即发出
+                self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"未知接口: {self.path}"}})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+
+                if server._should_fail():
+                    server.stats.record(prompt, error=True)
+                    self._send_json(server.error_status, {
+                        "error": {"message": "模拟服务注入的错误", "type": "stub_error", "code": server.error_status}
+                    })
+                    return
+
+                answer = server.build_answer(prompt)
+                server.stats.record(prompt, len(answer))
+                model = body.get("model", "stub")
+                usage = {
+                    "prompt_tokens": len(prompt) // server.chars_per_token,
+                    "completion_tokens": (len(answer) // server.chars_per_token) + server.reasoning_tokens,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+                if not body.get("stream"):
+                    self._send_json(200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+                        "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": answer}}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                created = int(time.time())
+                interval = 1 / server.tokens_per_second if server.tokens_per_second > 0 else 0
+
+                def chunk(delta: dict, finish_reason: Optional[str] = None) -> dict:
+                    return {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                            "model": model,
+                            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+                try:
+                    # 先返回思考过程，再逐段返回回复内容
+                    for _ in range(server.reasoning_tokens):
+                        self._send_event(chunk({"reasoning_content": "嗯" * server.chars_per_token}))
+                        if interval:
+                            time.sleep(interval)
+                    step = server.chars_per_token
+                    for i in range(0, len(answer), step):
+                        self._send_event(chunk({"content": answer[i:i + step]}))
+                        if interval:
+                            time.sleep(interval)
+                    self._send_event(chunk({}, "stop"))
+                    # 最后单独返回一个用量，choices为空
+                    self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                                      "model": model, "choices": [], "usage": usage})
+                    self._send_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.warning("客户端提前断开连接")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地模拟大模型服务')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='每秒返回的token数，0 表示不限速')
+    parser.add_argument('--reasoning-tokens', type=int, default=20, help='回复前返回的思考过程token数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='请求返回错误的概率')
+    parser.add_argument('--error-status', type=int, default=429, help='注入错误的HTTP状态码')
+    args = parser.parse_args()
+
+    stub = StubLLMServer(port=args.port, tokens_per_second=args.tokens_per_second,
+                         reasoning_tokens=args.reasoning_tokens, error_rate=args.error_rate,
+                         error_status=args.error_status)
+    print(f"base_url: {stub.base_url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
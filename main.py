@@ -1,110 +1,428 @@
 import argparse
 import asyncio
-import multiprocessing
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Set
 
-from cuter import cut_video
+from config import PIPELINE_SETTINGS, SEGMENT_CATALOG_SETTINGS, WATCH_SETTINGS
+from cover import CoverGenerator
+from cuter import clip_path, create_cut_executor, cut_video_stream
+from job_store import (RECORDING_ANALYZED, RECORDING_DONE, RECORDING_PENDING, SEGMENT_COVER, SEGMENT_CUT,
+                       SEGMENT_PENDING, SEGMENT_UPLOADED, JobStore, segment_key, split_segment_key)
+from llm_client import aclose_clients
 from logger import setup_logger
-from qwen import Qwen
-from subtitle_process import process_subtitle_segments
+from segment_catalog import STATUS_CUT, STATUS_FAILED, STATUS_PENDING, STATUS_UPLOADED, SegmentCatalog
+from segment_dedup import SegmentDeduper
+from segment_parser import Segment
+from subtitle_process import analyze_subtitle_segments
 from uploader import upload
+from watcher import RecordingWatcher
 
 logger = setup_logger('main')
 
+# 与字幕文件同名的录播视频
+VIDEO_EXTENSIONS = ('.flv', '.mp4', '.mkv', '.ts', '.avi', '.mov', '.webm')
+
+# 任务记录中的分段阶段对应的分段目录状态，分段编辑器和处理工具据此显示进度
+_CATALOG_STATUS = {
+    SEGMENT_PENDING: STATUS_PENDING,
+    SEGMENT_CUT: STATUS_CUT,
+    SEGMENT_COVER: STATUS_CUT,
+    SEGMENT_UPLOADED: STATUS_UPLOADED,
+}
+
 
 class VideoProcessor:
-    def __init__(self, input_dir: str):
+    """
+    分段流水线：分析(网络等待为主)、切割(CPU)和上传(网络)各有独立的并发数，
+    阶段之间是有界队列，切割跟不上时分析暂停读取回复，上传跟不上时切割暂停提交；多个录像同时在流水线中，
+    总耗时接近最慢的一个阶段而不是各阶段之和
+    """
+
+    def __init__(self, input_dir: str, workers: Optional[int] = None, use_llm_cache: bool = True,
+                 resume: bool = True, recordings: Optional[int] = None, upload_workers: Optional[int] = None):
         self.input_dir = input_dir
-        self.qwen = None
-        self.max_workers = multiprocessing.cpu_count()
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.workers = workers
+        self.use_llm_cache = use_llm_cache
+        # False 时忽略之前的处理记录，全部重新处理
+        self.resume = resume
+        self.recordings = recordings or PIPELINE_SETTINGS["recordings"]
+        self.upload_workers = upload_workers or PIPELINE_SETTINGS["upload_workers"]
+        self.catalog = SegmentCatalog()
+        self.jobs = JobStore()
+        self._cover_generator: Optional[CoverGenerator] = None
+        # 流水线运行时的状态，由 start 创建
+        self._recording_slots: Optional[asyncio.Semaphore] = None
+        self._uploads: Optional[asyncio.Queue] = None
+        self._uploaders: List[asyncio.Task] = []
+        self._cut_executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # 正在处理的录像名，同一录像不会同时处理两次
+        self._active: Set[str] = set()
+        # 处理期间再次提交的字幕，当前处理结束后重新提交
+        self._rerun: Set[str] = set()
+        # resume 为 False 时已清除过记录的录像，重试和重新提交时继续之前的进度，不再重复上传
+        self._reset: Set[str] = set()
 
     async def process_all(self) -> None:
         try:
-            # 处理所有srt文件
-            for file in os.listdir(self.input_dir):
+            await self.start()
+            # 所有srt文件一起进入流水线，同时分析和切割的录像数受 recordings 限制
+            for file in sorted(os.listdir(self.input_dir)):
                 if file.endswith('.srt'):
-                    srt_path = os.path.join(self.input_dir, file)
-                    self.process_srt(srt_path)
-
-            # 读取分析结果并处理视频
-            for file in os.listdir(self.input_dir):
-                if file.endswith('.txt'):
-                    with open(os.path.join(self.input_dir, file), 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        video_info = self._parse_analysis(content, file)
-                        if video_info:
-                            async for title, cut_path in self._process_video(video_info):
-                                try:
-                                    await upload(title, cut_path)
-                                    logger.info(f"上传完成: {title}")
-                                except Exception as e:
-                                    logger.error(f"上传失败 {title}: {str(e)}")
+                    self.submit(os.path.join(self.input_dir, file))
+            await self.join()
 
         except Exception as e:
             logger.error(f"批量处理失败: {str(e)}")
             raise
+        finally:
+            await self.close()
+
+    async def watch(self) -> None:
+        """
+        持续监视输入目录，字幕和同名视频写完后立即放入流水线，直到被中断
+        已处理完成的录像由任务记录跳过，分析或上传失败的录像定时重新处理
+        """
+        retry = None
+        try:
+            await self.start()
+            if WATCH_SETTINGS["retry_interval"] > 0:
+                retry = asyncio.create_task(self._retry_unfinished(WATCH_SETTINGS["retry_interval"]))
+            watcher = RecordingWatcher(self.input_dir, VIDEO_EXTENSIONS)
+            async for srt_path in watcher.ready():
+                self.submit(srt_path)
+        finally:
+            if retry:
+                retry.cancel()
+            await self.close()
+
+    async def _retry_unfinished(self, interval: float) -> None:
+        """定时重新提交输入目录中未处理完成的录像，正在处理的录像不重复提交"""
+        input_dir = os.path.abspath(self.input_dir)
+        while True:
+            await asyncio.sleep(interval)
+            for name, srt_path in self.jobs.unfinished_recordings().items():
+                if name in self._active or os.path.dirname(os.path.abspath(srt_path)) != input_dir:
+                    continue
+                # 没有视频的录像只分析字幕，不会进入完成状态
+                if not os.path.exists(srt_path) or not self._find_video(srt_path):
+                    continue
+                logger.info(f"重新处理未完成的录像: {srt_path}")
+                self.submit(srt_path)
+
+    async def start(self) -> None:
+        """创建各阶段共用的进程池、上传队列和上传任务"""
+        self._recording_slots = asyncio.Semaphore(self.recordings)
+        self._uploads = asyncio.Queue(maxsize=PIPELINE_SETTINGS["upload_queue"])
+        self._cut_executor = create_cut_executor(self.workers)
+        self._uploaders = [asyncio.create_task(self._upload_worker()) for _ in range(self.upload_workers)]
+        logger.info(f"流水线已启动: 同时处理 {self.recordings} 个录像, {self.upload_workers} 个上传任务")
+
+    def submit(self, srt_path: str) -> Optional[asyncio.Task]:
+        """把录像放入流水线，立即返回；录像正在处理时等处理结束后再放入，返回 None"""
+        name = self._recording_name(srt_path)
+        if name in self._active:
+            logger.info(f"录像正在处理，结束后重新处理: {srt_path}")
+            self._rerun.add(srt_path)
+            return None
+        self._active.add(name)
+        task = asyncio.create_task(self._run_recording(srt_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def join(self) -> None:
+        """等待已提交的录像全部处理完成"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+        await self._uploads.join()
+
+    async def close(self) -> None:
+        for task in list(self._tasks) + self._uploaders:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._uploaders, return_exceptions=True)
+        self._uploaders = []
+        if self._cut_executor:
+            self._cut_executor.shutdown(wait=False, cancel_futures=True)
+            self._cut_executor = None
+        # 关闭所有分析共用的连接池
+        await aclose_clients()
+
+    async def _run_recording(self, srt_path: str) -> None:
+        # 单个录像失败不影响流水线中的其他录像
+        try:
+            await self.process_recording(srt_path)
+        except Exception as e:
+            logger.error(f"录像处理失败 {srt_path}: {str(e)}")
+        finally:
+            self._active.discard(self._recording_name(srt_path))
+        if srt_path in self._rerun:
+            self._rerun.discard(srt_path)
+            self.submit(srt_path)
+
+    @staticmethod
+    def _recording_name(srt_path: str) -> str:
+        return os.path.splitext(os.path.basename(srt_path))[0]
+
+    @staticmethod
+    def _find_video(srt_path: str) -> Optional[str]:
+        stem = os.path.splitext(srt_path)[0]
+        for ext in VIDEO_EXTENSIONS:
+            if os.path.exists(stem + ext):
+                return stem + ext
+        return None
+
+    async def process_recording(self, srt_path: str) -> None:
+        """
+        分析字幕的同时切割：回复中每出现一个完整分段就放入切割队列，
+        第一个切片不必等整个字幕分析完成；切好的片段放入上传队列，由上传任务并行上传
+        每一步的进度都记录在任务记录中，中断后重新运行时跳过已分析的字幕和已上传的分段
+        需要先调用 start
+        """
+        name = self._recording_name(srt_path)
+        if not self.resume and name not in self._reset:
+            self.jobs.reset(name)
+            self._reset.add(name)
+        stage = self.jobs.open_recording(name, srt_path)
+        if stage == RECORDING_DONE:
+            logger.info(f"录像已处理完成，跳过: {srt_path}")
+            return
+
+        video_path = self._find_video(srt_path)
+        # 相邻字幕块在重叠处给出的重复分段只切割上传一次
+        deduper = SegmentDeduper()
+        kept: List[Segment] = []
+
+        def keep(segment: Segment) -> bool:
+            if not deduper.add(segment):
+                return False
+            kept.append(segment)
+            return True
+
+        async def collect(segment: Segment) -> None:
+            keep(segment)
+
+        if not video_path:
+            logger.warning(f"未找到字幕对应的视频，只分析字幕: {srt_path}")
+            if stage == RECORDING_PENDING:
+                async with self._recording_slots:
+                    await self.process_srt(srt_path, on_segment=collect)
+                self._save_segments(name, srt_path, None, kept)
+                self.jobs.set_recording_stage(name, RECORDING_ANALYZED)
+            return
+
+        uploads: List[asyncio.Future] = []
+        async with self._recording_slots:
+            # 上次已切好但没有上传完成的分段直接上传，不再切割
+            finished = set()
+            for key, job in self.jobs.segments(name).items():
+                if job["stage"] == SEGMENT_UPLOADED:
+                    finished.add(key)
+                elif job["stage"] in (SEGMENT_CUT, SEGMENT_COVER) and job["cut_path"] \
+                        and os.path.exists(job["cut_path"]):
+                    finished.add(key)
+                    uploads.append(await self._queue_upload(name, key, job["title"], job["cut_path"],
+                                                            job["cover_path"]))
+
+            # 分析和切割之间的有界队列，切割跟不上时分析暂停读取回复
+            queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_SETTINGS["segment_queue"])
+            if stage == RECORDING_PENDING:
+                analysis = asyncio.create_task(self.process_srt(srt_path, on_segment=queue.put))
+            else:
+                # 已分析过的录像使用分段目录中的分段(可能已在分段编辑器中修改)，不再请求大模型
+                logger.info(f"字幕已分析，使用分段目录中的分段: {srt_path}")
+                analysis = asyncio.create_task(self._load_segments(name, queue.put))
+            keys = {}
 
+            async def next_segment() -> Optional[Segment]:
+                """取出下一个分段，分析结束(包括失败)且队列已取空时返回 None"""
+                while queue.empty():
+                    if analysis.done():
+                        return None
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, analysis}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        return getter.result()
+                    getter.cancel()
+                return queue.get_nowait()
 
-    async def _process_video(self, video_info: dict):
+            async def segments() -> AsyncIterator[dict]:
+                while True:
+                    segment = await next_segment()
+                    if segment is None:
+                        return
+                    if not keep(segment):
+                        continue
+                    key = segment_key(segment.start_time, segment.end_time)
+                    if key in finished:
+                        continue
+                    self.jobs.add_segment(name, key, segment.title)
+                    split = asdict(segment)
+                    # 切片路径对每个分段唯一，标题可能重复
+                    keys[clip_path(name, split)] = key
+                    yield split
+
+            video_info = {
+                "video_path": video_path,
+                "video_name": name,
+                "srt_path": srt_path,
+            }
+            cut_failed = False
+            try:
+                try:
+                    async for title, cut_path in self._process_video(video_info, segments()):
+                        key = keys.get(cut_path)
+                        if key is None:
+                            logger.warning(f"切片没有对应的分段记录: {title}")
+                            continue
+                        self._advance(name, key, SEGMENT_CUT, cut_path=cut_path)
+                        # 上传队列已满时在这里等待，切割随之暂停提交新的片段
+                        uploads.append(await self._queue_upload(name, key, title, cut_path))
+                except Exception:
+                    # 已切好的片段照常上传，分析给出的其余分段继续记录，但录像不算处理完成
+                    cut_failed = True
+                    async for _ in segments():
+                        pass
+                await analysis
+                if stage == RECORDING_PENDING:
+                    self._save_segments(name, srt_path, video_path, kept)
+                    self.jobs.set_recording_stage(name, RECORDING_ANALYZED)
+            finally:
+                if not analysis.done():
+                    analysis.cancel()
+
+        # 分析和切割已完成，让出位置给下一个录像，再等待本录像的上传
+        await asyncio.gather(*uploads)
+        # 去重后的全部分段都上传完成、切割也没有出错时录像才算处理完成
+        unfinished = self.jobs.unfinished(name, [segment_key(s.start_time, s.end_time) for s in kept])
+        if cut_failed:
+            logger.warning(f"切割出错，录像下次运行时重试: {srt_path}")
+            return
+        if unfinished:
+            logger.warning(f"录像还有 {len(unfinished)} 个分段未上传，下次运行时重试: {srt_path}")
+            return
+        self.jobs.set_recording_stage(name, RECORDING_DONE)
+        logger.info(f"录像处理完成: {srt_path}")
+
+    async def _queue_upload(self, name: str, key: str, title: str, cut_path: str,
+                            cover: Optional[str] = None) -> asyncio.Future:
+        """放入上传队列，返回上传结束(成功或失败)时完成的 Future"""
+        done = asyncio.get_running_loop().create_future()
+        await self._uploads.put((name, key, title, cut_path, cover, done))
+        return done
+
+    async def _upload_worker(self) -> None:
+        while True:
+            name, key, title, cut_path, cover, done = await self._uploads.get()
+            try:
+                await self._publish(name, key, title, cut_path, cover)
+            finally:
+                if not done.done():
+                    done.set_result(None)
+                self._uploads.task_done()
+
+    async def _load_segments(self, name: str, on_segment: Callable[[Segment], Awaitable[None]]) -> None:
+        for segment in self.catalog.segments(name):
+            await on_segment(Segment(segment["start_time"], segment["end_time"], segment["title"], segment["summary"]))
+
+    async def _publish(self, name: str, key: str, title: str, cut_path: str, cover: Optional[str] = None) -> None:
+        """生成封面并上传切片，每完成一步记录一次；失败时记录原因，下次运行时重试"""
+        try:
+            if not cover or not os.path.exists(cover):
+                if self._cover_generator is None:
+                    self._cover_generator = CoverGenerator()
+                cover = await asyncio.get_running_loop().run_in_executor(
+                    None, self._cover_generator.generate_cover, title
+                )
+                cover = os.path.abspath(cover)
+                self._advance(name, key, SEGMENT_COVER, cover_path=cover)
+            upload_id = await upload(title, cut_path, cover)
+            self._advance(name, key, SEGMENT_UPLOADED, upload_id=upload_id)
+            logger.info(f"上传完成: {title}")
+        except Exception as e:
+            self.jobs.record_error(name, key, str(e))
+            self._set_catalog_status(name, key, STATUS_FAILED)
+            logger.error(f"上传失败 {title}: {str(e)}")
+
+    def _advance(self, name: str, key: str, stage: str, **fields) -> None:
+        """推进任务记录中分段的阶段，同时更新分段目录中的状态"""
+        self.jobs.update_segment(name, key, stage, **fields)
+        self._set_catalog_status(name, key, _CATALOG_STATUS[stage])
+
+    def _set_catalog_status(self, name: str, key: str, status: str) -> None:
+        # 分析完成前分段还没有写入分段目录，写入时再按任务记录补上状态
+        start_time, end_time = split_segment_key(key)
+        try:
+            self.catalog.set_status_at(name, start_time, end_time, status)
+        except Exception as e:
+            logger.warning(f"分段目录状态更新失败 {name} {key}: {str(e)}")
+
+    async def _process_video(self, video_info: dict, segments: AsyncIterator[dict]):
         """异步处理视频切片"""
         try:
-            # 使用线程池执行CPU密集型的视频切片任务
-            async for result in cut_video(video_info):
+            # 切片任务随分段到达提交到进程池并发执行，按完成顺序返回
+            async for result in cut_video_stream(video_info, segments, workers=self.workers,
+                                                 executor=self._cut_executor):
                 yield result
         except Exception as e:
             logger.error(f"视频处理失败: {str(e)}")
+            raise
+
+    def _save_segments(self, name: str, srt_path: str, video_path: Optional[str], segments: List[Segment]) -> None:
+        """
+        分析完成后把去重后的分段写入分段目录，按配置同时导出原有格式的JSON
+        分析期间已切割或上传的分段按任务记录写入状态
+        """
+        jobs = self.jobs.segments(name)
+        rows = []
+        for segment in segments:
+            row = asdict(segment)
+            job = jobs.get(segment_key(segment.start_time, segment.end_time))
+            if job:
+                row["status"] = STATUS_FAILED if job["error"] else _CATALOG_STATUS[job["stage"]]
+            rows.append(row)
+        self.catalog.add_video(name, video_path, srt_path)
+        self.catalog.add_segments(name, rows, replace=True)
+        if SEGMENT_CATALOG_SETTINGS["export_json"]:
+            self.catalog.export_json(name, f"{name}_segments.json")
 
-    def process_srt(self, srt_file: str) -> None:
+    async def process_srt(self, srt_file: str,
+                          on_segment: Optional[Callable[[Segment], Awaitable[None]]] = None) -> None:
         try:
-            name = os.path.splitext(os.path.basename(srt_file))[0]
-            self.qwen = Qwen(name)
-            process_subtitle_segments(srt_file)
+            await analyze_subtitle_segments(srt_file, use_cache=self.use_llm_cache, on_segment=on_segment)
             logger.info(f"字幕分析完成: {srt_file}")
         except Exception as e:
             logger.error(f"字幕处理失败: {str(e)}")
             raise
 
-    def _parse_analysis(self, content: str, filename: str) -> Optional[dict]:
-        try:
-            # 解析分析结果，提取切片信息
-            segments = []
-            current_segment = None
-
-            for line in content.split('\n'):
-                line = line.strip()
-                if line.startswith('- 时间：'):
-                    times = line.split('：')[1].strip('[]').split(' --> ')
-                    current_segment = {'start': times[0], 'end': times[1]}
-                elif line.startswith('- 标题：') and current_segment:
-                    current_segment['title'] = line.split('：')[1].strip()
-                    segments.append(f"{current_segment['start']} {current_segment['end']} {current_segment['title']}")
-
-            if segments:
-                return {
-                    "title": os.path.splitext(filename)[0],
-                    "subs": segments
-                }
-            return None
-
-        except Exception as e:
-            logger.error(f"解析分析结果失败: {str(e)}")
-            return None
-
 
 def main():
     parser = argparse.ArgumentParser(description='视频切片处理工具')
     parser.add_argument('--input', '-i', required=True, help='输入目录，包含srt文件和视频文件')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='并发切割的进程数，默认使用CPU核心数')
+    parser.add_argument('--no-llm-cache', action='store_true', help='不使用大模型回复缓存，重新请求所有字幕块')
+    parser.add_argument('--fresh', action='store_true', help='忽略之前的处理记录，重新分析、切割和上传所有录像')
+    parser.add_argument('--recordings', '-r', type=int, default=None, help='同时分析和切割的录像数，默认使用配置')
+    parser.add_argument('--upload-workers', type=int, default=None, help='同时上传的切片数，默认使用配置')
+    parser.add_argument('--watch', action='store_true', help='持续监视输入目录，新录像写完后立即处理')
 
     args = parser.parse_args()
 
-    processor = VideoProcessor(args.input)
-    # 全部处理
-    asyncio.run(processor.process_all())
+    processor = VideoProcessor(args.input, workers=args.workers, use_llm_cache=not args.no_llm_cache,
+                               resume=not args.fresh, recordings=args.recordings,
+                               upload_workers=args.upload_workers)
+    if args.watch:
+        try:
+            asyncio.run(processor.watch())
+        except KeyboardInterrupt:
+            logger.info("已停止监视")
+    else:
+        # 全部处理
+        asyncio.run(processor.process_all())
+
 
-   
 
 
 if __name__ == "__main__":
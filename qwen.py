@@ -1,27 +1,15 @@
-import sys
+import asyncio
+from typing import Awaitable, Callable, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from config import QWEN_CONFIG
+from analysis_sink import QwenResponse
+from config import QWEN_CONFIG, LLM_CACHE_SETTINGS
+from llm_cache import ResponseCache
+from llm_client import get_async_client
 from logger import setup_logger
 
-
-class Qwen:
-    def __init__(self, title: str):
-        self.client = OpenAI(
-            api_key=QWEN_CONFIG["api_key"],
-            base_url=QWEN_CONFIG["base_url"]
-        )
-        self.title = title
-        self.logger = setup_logger('qwen')
-
-    def __req_qwen(self, text: str):
-        try:
-            reasoning_content = ""
-            answer_content = ""
-            is_answering = False
-
-            system_prompt = """
+SYSTEM_PROMPT = """
                     请分析以下字幕内容，根据主题和内容的变化进行分段。对于每个分段：
         
                     1. 标题要求：
@@ -60,50 +48,81 @@ class Qwen:
                     ...
                     """
 
-            messages = [
-                {"role": "assistant", "content": system_prompt},
-                {"role": "user", "content": text}
-            ]
+# 提示词版本，修改 SYSTEM_PROMPT 或回复格式后递增，使旧的缓存回复失效
+PROMPT_VERSION = "1"
+
+def build_messages(text: str) -> list:
+    return [
+        {"role": "assistant", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": text}
+    ]
+
 
-            # 创建聊天完成请求
-            completion = self.client.chat.completions.create(
-                model=QWEN_CONFIG["model"],
-                messages=messages,
-                stream=True
-            )
-            # print("\n" + "=" * 20 + "思考过程" + "=" * 20 + "\n")
-            for chunk in completion:
-                # 如果chunk.choices为空，则打印usage
-                if not chunk.choices:
-                    print("\nUsage:")
-                    print(chunk.usage)
-                else:
-                    delta = chunk.choices[0].delta
-                    # 打印思考过程
-                    if hasattr(delta, 'reasoning_content') and delta.reasoning_content != None:
-                        # print(delta.reasoning_content, end='', flush=True)
-                        reasoning_content += delta.reasoning_content
-                    else:
-                        # 开始回复
-                        if delta.content != "" and is_answering is False:
-                            print("\n" + "=" * 20 + "完整回复" + "=" * 20 + "\n")
-                            is_answering = True
-                        # 打印回复过程
-                        print(delta.content, end='', flush=True)
-                        answer_content += delta.content
-            # self.message_queue.append({"role": "assistant", "content": answer_content})
-            print("\n")
+class Qwen:
+    def __init__(self, title: str, use_cache: Optional[bool] = None):
+        self.title = title
+        self.logger = setup_logger('qwen')
+        if use_cache is None:
+            use_cache = LLM_CACHE_SETTINGS["enabled"]
+        self.cache = ResponseCache() if use_cache else None
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return get_async_client()
+
+    def _cache_key(self, text: str) -> str:
+        return ResponseCache.make_key(QWEN_CONFIG["model"], build_messages(text), PROMPT_VERSION)
+
+    def cached_response(self, text: str) -> Optional[QwenResponse]:
+        """读取缓存的回复，未启用缓存或未命中时返回 None"""
+        if not self.cache:
+            return None
+        try:
+            cached = self.cache.get(self._cache_key(text))
         except Exception as e:
-            self.logger.error(f"请求失败: {str(e)}")
-            raise
+            self.logger.warning(f"读取回复缓存失败: {str(e)}")
+            return None
+        if cached:
+            self.logger.info(f"命中回复缓存: {self.title}")
+            return QwenResponse(*cached)
+        return None
 
-    def req_qwen(self, text: str):
+    def _store(self, text: str, response: QwenResponse) -> None:
+        if not self.cache or not response.answer_content:
+            return
         try:
-            with open(f'{self.title}.txt', "a", encoding="utf-8") as f:
-                sys.stdout = f
-                self.__req_qwen(text)
+            self.cache.put(self._cache_key(text), QWEN_CONFIG["model"], PROMPT_VERSION,
+                           response.reasoning_content, response.answer_content, response.usage)
         except Exception as e:
-            self.logger.error(f"处理失败: {str(e)}")
-            raise
-        finally:
-            sys.stdout = sys.__stdout__
+            self.logger.warning(f"写入回复缓存失败: {str(e)}")
+
+    async def analyze(self, text: str, on_content: Optional[Callable[[str], Awaitable[None]]] = None) -> QwenResponse:
+        """
+        异步流式请求一次分析，返回思考过程和回复内容，不写入文件
+        不查询回复缓存(由调用方先用 cached_response 查询)，完整的回复写入缓存
+        on_content: 每收到一段回复内容时等待其完成；下游处理不过来时在其中等待，回复的读取随之暂停
+        """
+        reasoning_content = ""
+        answer_content = ""
+        usage = None
+
+        completion = await self.async_client.chat.completions.create(
+            model=QWEN_CONFIG["model"],
+            messages=build_messages(text),
+            stream=True
+        )
+        async for chunk in completion:
+            if not chunk.choices:
+                usage = chunk.usage.model_dump() if chunk.usage else None
+                continue
+            delta = chunk.choices[0].delta
+            if getattr(delta, 'reasoning_content', None) is not None:
+                reasoning_content += delta.reasoning_content
+            elif delta.content:
+                answer_content += delta.content
+                if on_content:
+                    await on_content(delta.content)
+        response = QwenResponse(reasoning_content, answer_content, usage)
+        # sqlite写入放到线程池中执行，不阻塞其他正在进行的请求
+        await asyncio.get_running_loop().run_in_executor(None, self._store, text, response)
+        return response
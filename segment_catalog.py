@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import asdict, is_dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from config import SEGMENT_CATALOG_SETTINGS
+from logger import setup_logger
+from timecode import parse_srt_time
+
+logger = setup_logger('segment_catalog')
+
+# 分段状态
+STATUS_PENDING = "pending"
+STATUS_CUT = "cut"
+STATUS_UPLOADED = "uploaded"
+STATUS_FAILED = "failed"
+SEGMENT_STATUSES = (STATUS_PENDING, STATUS_CUT, STATUS_UPLOADED, STATUS_FAILED)
+
+# 可以单独修改的字段
+_EDITABLE_FIELDS = ("start_time", "end_time", "title", "summary", "status")
+_SEGMENT_COLUMNS = "id, video, start_time, end_time, title, summary, status"
+
+
+def _as_dict(segment) -> dict:
+    return asdict(segment) if is_dataclass(segment) else dict(segment)
+
+
+class SegmentCatalog:
+    """
+    所有录像分段的sqlite目录，替代分散的 *_segments.json：
+    按 (录像, 开始时间) 和状态建立索引，支持批量写入、时间范围查询和单条修改，
+    修改一个标题只更新一行，不必重写整个文件；仍可导入导出原有JSON格式
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or SEGMENT_CATALOG_SETTINGS["db_path"]
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            # WAL模式下编辑器读取时，处理流程仍可以写入
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    name TEXT PRIMARY KEY,
+                    video_path TEXT,
+                    srt_path TEXT,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    video TEXT NOT NULL,
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_video_start ON segments (video, start_ms)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_status ON segments (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可以在多个线程中同时使用
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add_video(self, name: str, video_path: Optional[str] = None, srt_path: Optional[str] = None) -> None:
+        """记录录像，已存在时只更新给出的路径"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                INSERT INTO videos (name, video_path, srt_path, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    video_path = COALESCE(excluded.video_path, video_path),
+                    srt_path = COALESCE(excluded.srt_path, srt_path),
+                    updated = excluded.updated
+            """, (name, video_path, srt_path, time.time()))
+
+    def add_segments(self, video: str, segments: Iterable, replace: bool = False,
+                     status: str = STATUS_PENDING) -> int:
+        """
+        在一个事务中批量写入分段(Segment 或含 start_time/end_time/title/summary 的字典)
+        replace: 先删除该录像已有的分段，重新分析后使用
+        返回写入的分段数
+        """
+        now = time.time()
+        rows = []
+        for segment in segments:
+            segment = _as_dict(segment)
+            rows.append((video, parse_srt_time(segment["start_time"]), parse_srt_time(segment["end_time"]),
+                         segment["start_time"], segment["end_time"], segment["title"],
+                         segment.get("summary", ""), segment.get("status", status), now))
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR IGNORE INTO videos (name, updated) VALUES (?, ?)", (video, now))
+            if replace:
+                conn.execute("DELETE FROM segments WHERE video = ?", (video,))
+            conn.executemany("""
+                INSERT INTO segments (video, start_ms, end_ms, start_time, end_time, title, summary, status, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        logger.info(f"分段已写入目录: {video}, 共 {len(rows)} 个")
+        return len(rows)
+
+    def videos(self) -> List[dict]:
+        """所有录像及其分段数，按名称排序"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("""
+                SELECT v.name, v.video_path, v.srt_path, COUNT(s.id) AS total_segments
+                FROM videos v LEFT JOIN segments s ON s.video = v.name
+                GROUP BY v.name ORDER BY v.name
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def segments(self, video: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                 status: Optional[str] = None) -> List[dict]:
+        """按开始时间排序返回录像的分段，可以只取开始时间在 [start_ms, end_ms) 内或指定状态的分段"""
+        conditions, params = ["video = ?"], [video]
+        if start_ms is not None:
+            conditions.append("start_ms >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append("start_ms < ?")
+            params.append(end_ms)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {_SEGMENT_COLUMNS} FROM segments WHERE {' AND '.join(conditions)} ORDER BY start_ms, id",
+                params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, segment_id: int) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_SEGMENT_COLUMNS} FROM segments WHERE id = ?", (segment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, segment_id: int, **fields) -> bool:
+        """只修改一个分段的给定字段，返回分段是否存在"""
+        unknown = set(fields) - set(_EDITABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持修改的字段: {', '.join(sorted(unknown))}")
+        if fields.get("status", STATUS_PENDING) not in SEGMENT_STATUSES:
+            raise ValueError(f"未知的分段状态: {fields['status']}")
+        if not fields:
+            return self.get(segment_id) is not None
+
+        columns = dict(fields)
+        # 时间修改后同步更新用于范围查询的毫秒数
+        if "start_time" in fields:
+            columns["start_ms"] = parse_srt_time(fields["start_time"])
+        if "end_time" in fields:
+            columns["end_ms"] = parse_srt_time(fields["end_time"])
+        columns["updated"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(f"UPDATE segments SET {assignments} WHERE id = ?",
+                                  (*columns.values(), segment_id))
+        return cursor.rowcount > 0
+
+    def set_status(self, segment_ids: Iterable[int], status: str) -> None:
+        if status not in SEGMENT_STATUSES:
+            raise ValueError(f"未知的分段状态: {status}")
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("UPDATE segments SET status = ?, updated = ? WHERE id = ?",
+                             [(status, now, segment_id) for segment_id in segment_ids])
+
+    def set_status_at(self, video: str, start_time: str, end_time: str, status: str) -> int:
+        """按起止时间修改录像中分段的状态，返回修改的分段数"""
+        if status not in SEGMENT_STATUSES:
+            raise ValueError(f"未知的分段状态: {status}")
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute("""
+                UPDATE segments SET status = ?, updated = ?
+                WHERE video = ? AND start_time = ? AND end_time = ?
+            """, (status, time.time(), video, start_time, end_time))
+        return cursor.rowcount
+
+    def delete(self, segment_id: int) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+        return cursor.rowcount > 0
+
+    def video_info(self, video: str, status: Optional[str] = None) -> dict:
+        """按原有分段JSON的结构返回录像信息，可以直接交给 cut_video"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT video_path, srt_path FROM videos WHERE name = ?", (video,)).fetchone()
+        segments = [
+            {key: segment[key] for key in ("start_time", "end_time", "title", "summary")}
+            for segment in self.segments(video, status=status)
+        ]
+        info = {"video_name": video, "total_segments": len(segments), "segments": segments}
+        if row and row["video_path"]:
+            info["video_path"] = row["video_path"]
+        if row and row["srt_path"]:
+            info["srt_path"] = row["srt_path"]
+        return info
+
+    def import_json(self, json_file: str) -> Tuple[str, int]:
+        """导入原有格式的分段JSON，替换目录中同名录像的分段，返回 (录像名称, 分段数)"""
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            video = data.get("video_name") or os.path.splitext(os.path.basename(json_file))[0]
+            if data.get("video_path") or data.get("srt_path"):
+                self.add_video(video, data.get("video_path"), data.get("srt_path"))
+            return video, self.add_segments(video, data.get("segments", []), replace=True)
+        except Exception as e:
+            logger.error(f"导入分段JSON失败: {json_file}, 错误: {str(e)}")
+            raise
+
+    def export_json(self, video: str, json_file: str) -> None:
+        """按原有格式导出录像的分段"""
+        try:
+            info = self.video_info(video)
+            tmp_path = f"{json_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, json_file)
+            logger.info(f"分段信息已导出至: {json_file}")
+        except Exception as e:
+            logger.error(f"导出分段JSON失败: {json_file}, 错误: {str(e)}")
+            raise
@@ -0,0 +1,103 @@
+from array import array
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+from config import ANALYSIS_SETTINGS
+from logger import setup_logger
+from timecode import parse_srt_time
+
+logger = setup_logger('segment_dedup')
+
+
+def overlap_ratio(a_start: int, a_end: int, b_start: int, b_end: int) -> float:
+    """两个时间段的交集占并集的比例，完全相同为 1，不相交为 0"""
+    intersection = min(a_end, b_end) - max(a_start, b_start)
+    if intersection <= 0:
+        return 0.0
+    return intersection / (max(a_end, b_end) - min(a_start, b_start))
+
+
+def _span(segment) -> Tuple[int, int]:
+    return parse_srt_time(segment.start_time), parse_srt_time(segment.end_time)
+
+
+def _identity(segment) -> Tuple[int, int, str]:
+    # 标题和起止时间都相同的分段会切到同一个文件，无论阈值如何都只保留一个
+    return (*_span(segment), segment.title)
+
+
+class SegmentDeduper:
+    """
+    在线去重：已接受的分段按开始时间有序保存，新分段只与可能和它重叠的分段比较，
+    与任一已接受分段的重叠比例达到阈值即视为重复
+    分段可以是 segment_parser.Segment 或任何带 start_time/end_time/title 属性的对象
+    字幕块之间有重叠，相邻字幕块的回复经常在边界处给出相同或几乎相同的分段
+    """
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = ANALYSIS_SETTINGS["dedup_threshold"] if threshold is None else threshold
+        self.starts = array('q')
+        self.ends = array('q')
+        self.segments = []
+        # 已接受分段的最长时长，开始时间早于 新分段开始-最长时长 的分段不可能与它重叠
+        self.max_duration = 0
+        self.seen = set()
+
+    def find_duplicate(self, start_ms: int, end_ms: int) -> Optional[int]:
+        """返回与时间段重复的已接受分段下标"""
+        i = bisect_left(self.starts, end_ms) - 1
+        while i >= 0 and self.starts[i] > start_ms - self.max_duration:
+            if overlap_ratio(start_ms, end_ms, self.starts[i], self.ends[i]) >= self.threshold:
+                return i
+            i -= 1
+        return None
+
+    def _insert(self, start_ms: int, end_ms: int, segment) -> None:
+        i = bisect_left(self.starts, start_ms)
+        self.starts.insert(i, start_ms)
+        self.ends.insert(i, end_ms)
+        self.segments.insert(i, segment)
+        self.max_duration = max(self.max_duration, end_ms - start_ms)
+
+    def add(self, segment) -> bool:
+        """接受不重复的分段并返回 True，重复的分段丢弃并返回 False"""
+        identity = _identity(segment)
+        if identity in self.seen:
+            logger.info(f"丢弃完全相同的分段: {segment.title}")
+            return False
+        self.seen.add(identity)
+        if self.threshold <= 0:
+            return True
+        start_ms, end_ms = _span(segment)
+        duplicate = self.find_duplicate(start_ms, end_ms)
+        if duplicate is not None:
+            logger.info(f"丢弃重复分段: {segment.title} 与 {self.segments[duplicate].title} 重叠")
+            return False
+        self._insert(start_ms, end_ms, segment)
+        return True
+
+
+def dedupe_segments(segments: list, threshold: Optional[float] = None) -> list:
+    """
+    按开始时间扫描一遍去重，重复的分段保留时长较长的一个，结果按开始时间排序
+    分段已经全部确定时使用；边生成边切割时使用 SegmentDeduper
+    """
+    deduper = SegmentDeduper(threshold)
+    if deduper.threshold <= 0:
+        return [segment for segment in segments if deduper.add(segment)]
+    for segment in sorted(segments, key=lambda segment: parse_srt_time(segment.start_time)):
+        start_ms, end_ms = _span(segment)
+        duplicate = deduper.find_duplicate(start_ms, end_ms)
+        if duplicate is None:
+            deduper._insert(start_ms, end_ms, segment)
+            continue
+        kept = deduper.segments[duplicate]
+        if end_ms - start_ms > deduper.ends[duplicate] - deduper.starts[duplicate]:
+            logger.info(f"合并重复分段: 保留 {segment.title}，丢弃 {kept.title}")
+            del deduper.starts[duplicate], deduper.ends[duplicate], deduper.segments[duplicate]
+            deduper._insert(start_ms, end_ms, segment)
+        else:
+            logger.info(f"合并重复分段: 保留 {kept.title}，丢弃 {segment.title}")
+    if len(deduper.segments) < len(segments):
+        logger.info(f"分段去重: {len(segments)} -> {len(deduper.segments)}")
+    return deduper.segments
@@ -1,8 +1,9 @@
-import json
 import os
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
+from segment_catalog import SegmentCatalog
+
 
 class SegmentEditor:
     def __init__(self, root):
@@ -10,11 +11,12 @@ class SegmentEditor:
         self.root.title("分段编辑器")
         self.root.geometry("800x600")
 
-        self.current_file = None
-        self.segments_data = None
-        
-        # 添加文件名标签
-        self.file_label = ttk.Label(self.root, text="当前文件: 未加载")
+        # 分段保存在分段目录中，修改和删除只更新对应的一行
+        self.catalog = SegmentCatalog()
+        self.current_video = None
+
+        # 添加录像名称标签
+        self.file_label = ttk.Label(self.root, text="当前录像: 未加载")
         self.file_label.pack(fill='x', padx=5, pady=2)
 
         self.create_widgets()
@@ -24,8 +26,15 @@ class SegmentEditor:
         btn_frame = ttk.Frame(self.root)
         btn_frame.pack(fill='x', padx=5, pady=5)
 
-        ttk.Button(btn_frame, text="打开JSON", command=self.load_json).pack(side='left', padx=5)
-        ttk.Button(btn_frame, text="保存修改", command=self.save_changes).pack(side='left', padx=5)
+        ttk.Label(btn_frame, text="录像:").pack(side='left', padx=5)
+        self.video_var = tk.StringVar()
+        self.video_combo = ttk.Combobox(btn_frame, textvariable=self.video_var, state='readonly', width=40,
+                                        postcommand=self.refresh_videos)
+        self.video_combo.pack(side='left', padx=5)
+        self.video_combo.bind('<<ComboboxSelected>>', lambda _: self.load_video(self.video_var.get()))
+
+        ttk.Button(btn_frame, text="导入JSON", command=self.load_json).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="导出JSON", command=self.save_changes).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="删除分段", command=self.delete_segment).pack(side='left', padx=5)
 
         # 分段列表
@@ -78,6 +87,18 @@ class SegmentEditor:
         # 绑定选择事件
         self.segments_tree.bind('<<TreeviewSelect>>', self.on_select)
 
+    def refresh_videos(self):
+        self.video_combo['values'] = [video['name'] for video in self.catalog.videos()]
+
+    def load_video(self, video):
+        try:
+            self.current_video = video
+            self.video_var.set(video)
+            self.file_label.config(text=f"当前录像: {video}")
+            self.refresh_tree()
+        except Exception as e:
+            messagebox.showerror("错误", f"加载分段失败: {str(e)}")
+
     def load_json(self):
         file_path = filedialog.askopenfilename(
             filetypes=[("JSON files", "*.json")],
@@ -85,23 +106,20 @@ class SegmentEditor:
         )
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    self.segments_data = json.load(f)
-                self.current_file = file_path
-                # 更新文件名标签
-                self.file_label.config(text=f"当前文件: {os.path.basename(file_path)}")
-                self.refresh_tree()
-                messagebox.showinfo("成功", "成功加载JSON文件")
+                video, _ = self.catalog.import_json(file_path)
+                self.load_video(video)
+                messagebox.showinfo("成功", "成功导入JSON文件")
             except Exception as e:
-                messagebox.showerror("错误", f"加载文件失败: {str(e)}")
+                messagebox.showerror("错误", f"导入文件失败: {str(e)}")
 
     def refresh_tree(self):
         for item in self.segments_tree.get_children():
             self.segments_tree.delete(item)
 
-        if self.segments_data and 'segments' in self.segments_data:
-            for segment in self.segments_data['segments']:
-                self.segments_tree.insert('', 'end', values=(
+        if self.current_video:
+            # 树形视图的项以分段编号为ID，修改时直接定位到对应的行
+            for segment in self.catalog.segments(self.current_video):
+                self.segments_tree.insert('', 'end', iid=str(segment['id']), values=(
                     segment['start_time'],
                     segment['end_time'],
                     segment['title'],
@@ -126,36 +144,43 @@ class SegmentEditor:
             messagebox.showwarning("警告", "请先选择一个分段")
             return
 
-        # 更新树形视图
-        self.segments_tree.item(selected[0], values=(
+        values = (
             self.start_var.get(),
             self.end_var.get(),
             self.title_var.get(),
             self.summary_text.get('1.0', 'end-1c')
-        ))
+        )
+        try:
+            # 只更新这一个分段
+            self.catalog.update(int(selected[0]), start_time=values[0], end_time=values[1],
+                                title=values[2], summary=values[3])
+        except Exception as e:
+            messagebox.showerror("错误", f"更新失败: {str(e)}")
+            return
 
-        # 更新数据
-        idx = self.segments_tree.index(selected[0])
-        self.segments_data['segments'][idx].update({
-            'start_time': self.start_var.get(),
-            'end_time': self.end_var.get(),
-            'title': self.title_var.get(),
-            'summary': self.summary_text.get('1.0', 'end-1c')
-        })
+        # 更新树形视图
+        self.segments_tree.item(selected[0], values=values)
 
         messagebox.showinfo("成功", "分段更新成功")
 
     def save_changes(self):
-        if not self.current_file or not self.segments_data:
-            messagebox.showwarning("警告", "没有可保存的数据")
+        if not self.current_video:
+            messagebox.showwarning("警告", "没有可导出的数据")
             return
 
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")],
+            initialdir=os.getcwd(),
+            initialfile=f"{self.current_video}_segments.json"
+        )
+        if not file_path:
+            return
         try:
-            with open(self.current_file, 'w', encoding='utf-8') as f:
-                json.dump(self.segments_data, f, ensure_ascii=False, indent=2)
-            messagebox.showinfo("成功", "保存成功")
+            self.catalog.export_json(self.current_video, file_path)
+            messagebox.showinfo("成功", "导出成功")
         except Exception as e:
-            messagebox.showerror("错误", f"保存失败: {str(e)}")
+            messagebox.showerror("错误", f"导出失败: {str(e)}")
 
     def delete_segment(self):
         selected = self.segments_tree.selection()
@@ -164,24 +189,18 @@ class SegmentEditor:
             return
 
         if messagebox.askyesno("确认", "确定要删除选中的分段吗？"):
-            # 获取选中项的索引
-            idx = self.segments_tree.index(selected[0])
-            
-            # 从数据中删除
-            self.segments_data['segments'].pop(idx)
-            
+            # 从分段目录中删除
+            self.catalog.delete(int(selected[0]))
+
             # 从树形视图中删除
             self.segments_tree.delete(selected[0])
-            
-            # 更新总数
-            self.segments_data['total_segments'] = len(self.segments_data['segments'])
-            
+
             # 清空编辑区
             self.start_var.set('')
             self.end_var.set('')
             self.title_var.set('')
             self.summary_text.delete('1.0', tk.END)
-            
+
             messagebox.showinfo("成功", "分段已删除")
 
 
@@ -1,13 +1,22 @@
+import io
 import re
 import json
 import os.path
-from dataclasses import dataclass, asdict
-from typing import List
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
+from analysis_sink import RESPONSE_HEADER, USAGE_HEADER
+from config import SEGMENT_CATALOG_SETTINGS
 from logger import setup_logger
+from segment_catalog import SegmentCatalog
+from segment_dedup import dedupe_segments
+from timecode import TIME_BASE_MARKER, format_srt_time, parse_srt_time, resolve_time
 
 logger = setup_logger('segment_parser')
 
+# 分析结果文件中各部分标题行的前缀
+SEPARATOR = "=" * 20
+
 
 @dataclass
 class Segment:
@@ -19,101 +28,234 @@ class Segment:
 
 class SegmentParser:
     @staticmethod
-    def parse_time(time_str: str) -> str:
+    def parse_segments(content: str) -> List[Segment]:
+        """解析分析结果文本中所有完整回复的分段"""
         try:
-            # 移除方括号并分割
-            time = time_str.strip('[]')
-            if ',' in time:  # 如果包含毫秒
-                time = time.split(',')[0]
-
-            # 确保时间格式为 HH:MM:SS
-            parts = time.split(':')
-            if len(parts) == 2:  # 如果只有分和秒
-                parts.insert(0, '00')
-            return ':'.join(parts)
+            segments = [segment for _, segment in parse_analysis_lines(io.StringIO(content))]
+            if not segments:
+                logger.warning("未找到任何有效分段")
+            return segments
+
         except Exception as e:
-            logger.error(f"时间格式解析失败: {time_str}, 错误: {str(e)}")
+            logger.error(f"解析失败: {str(e)}")
             raise
 
-    @staticmethod
-    def parse_segments(content: str) -> List[Segment]:
-        try:
-            segments = []
 
-            # 首先找到完整回复部分
-            response_pattern = r"={20}完整回复={20}\n(.*?)(?:\n={20}|$)"
-            response_match = re.search(response_pattern, content, re.DOTALL)
+class _Block:
+    """正在解析的分段，字段按出现顺序填入"""
 
-            if not response_match:
-                logger.warning("未找到完整回复部分")
-                return segments
+    __slots__ = ('times', 'title', 'summary', 'summary_closed', 'blank')
 
-            response_content = response_match.group(1)
+    def __init__(self):
+        self.times: Optional[Tuple[str, str]] = None
+        self.title: Optional[str] = None
+        # 内容概要可能跨多行，"- 内容概要："之后缩进或列表形式的行都属于它
+        self.summary: Optional[List[str]] = None
+        # 遇到不属于内容概要的行后，直到下一个分段标题之前的行都忽略
+        self.summary_closed = False
+        # 内容概要中间的空行，后面还有内容概要时保留
+        self.blank = False
 
-            # 查找所有分段
-            pattern = r"分段\d+：\s*\n- 时间：\[(.*?)\] --> \[(.*?)\]\s*\n- 标题：(.*?)\s*\n- 内容概要：(.*?)(?=\n\n分段\d+：|$)"
-            matches = re.finditer(pattern, response_content, re.DOTALL)
 
-            for match in matches:
-                try:
-                    start_time = SegmentParser.parse_time(match.group(1))
-                    end_time = SegmentParser.parse_time(match.group(2))
-                    title = match.group(3).strip()
-                    summary = match.group(4).strip()
+class SegmentExtractor:
+    """
+    逐行解析回复中的分段的状态机，流式回复和分析结果文件共用
+    下一个"分段N："标题出现时上一个分段即已完整，不必等整个回复结束就可以交给切割
+    origin_ms: 紧凑时间戳模式下的时间基准
+    on_segment: 每提取出一个分段时调用
+    """
 
-                    segments.append(Segment(start_time, end_time, title, summary))
-                except Exception as e:
-                    logger.error(f"分段解析失败: {match.group(0)}, 错误: {str(e)}")
-                    continue
+    HEADER_PATTERN = re.compile(r"[#*\s]*分段\d+：")
+    TIME_PATTERN = re.compile(r"-\s*时间：\s*\[(.*?)\]\s*-->\s*\[(.*?)\]")
+    TITLE_PATTERN = re.compile(r"-\s*标题：(.*)")
+    SUMMARY_PATTERN = re.compile(r"-\s*内容概要：(.*)")
+    # 内容概要的后续行：缩进的行或列表项，回复末尾"以上是分段结果"之类的说明不属于内容概要
+    CONTINUATION_PATTERN = re.compile(r"\s+\S|[-*•·]|\d+[.、)）]")
 
-            if not segments:
-                logger.warning("未找到任何有效分段")
+    def __init__(self, origin_ms: Optional[int] = None, on_segment: Optional[Callable[[Segment], None]] = None):
+        self.origin_ms = origin_ms
+        self.on_segment = on_segment
+        # 增量中尚未换行的部分，最多一行
+        self._partial = ""
+        self._block: Optional[_Block] = None
+
+    def _close_block(self) -> Optional[Segment]:
+        block, self._block = self._block, None
+        if block is None:
+            return None
+        if block.times is None or block.title is None or block.summary is None:
+            logger.warning(f"分段格式无法识别: 时间={block.times}, 标题={block.title}")
+            return None
+        try:
+            # 保留毫秒，切割时按原始精度定位
+            start_time = format_srt_time(resolve_time(block.times[0], self.origin_ms))
+            end_time = format_srt_time(resolve_time(block.times[1], self.origin_ms))
+        except Exception as e:
+            logger.error(f"分段解析失败: {block.title}, 错误: {str(e)}")
+            return None
+        segment = Segment(start_time, end_time, block.title.strip(), "\n".join(block.summary).strip())
+        if self.on_segment:
+            self.on_segment(segment)
+        return segment
+
+    def feed_line(self, line: str) -> Optional[Segment]:
+        """处理一整行(不含换行符)，上一个分段因此完整时返回该分段"""
+        if self.HEADER_PATTERN.match(line):
+            segment = self._close_block()
+            self._block = _Block()
+            return segment
+        block = self._block
+        if block is None:
+            return None
+        if block.summary is not None:
+            self._feed_summary(block, line)
+            return None
+        stripped = line.strip()
+        match = self.TIME_PATTERN.match(stripped)
+        if match:
+            block.times = match.group(1, 2)
+            return None
+        match = self.TITLE_PATTERN.match(stripped)
+        if match:
+            block.title = match.group(1)
+            return None
+        match = self.SUMMARY_PATTERN.match(stripped)
+        if match:
+            block.summary = [match.group(1)]
+        return None
 
+    def _feed_summary(self, block: _Block, line: str) -> None:
+        if block.summary_closed:
+            return
+        if not line.strip():
+            block.blank = True
+            return
+        # "- 内容概要："后换行才开始的内容概要，第一行不要求缩进
+        if any(block.summary) and not self.CONTINUATION_PATTERN.match(line):
+            block.summary_closed = True
+            return
+        if block.blank and any(block.summary):
+            block.summary.append("")
+        block.blank = False
+        block.summary.append(line)
+
+    def feed(self, delta: str) -> List[Segment]:
+        """追加一段增量回复，返回其中新完整的分段"""
+        segments = []
+        if '\n' not in delta:
+            self._partial += delta
             return segments
+        *lines, rest = (self._partial + delta).split('\n')
+        self._partial = rest
+        for line in lines:
+            segment = self.feed_line(line)
+            if segment:
+                segments.append(segment)
+        return segments
 
-        except Exception as e:
-            logger.error(f"解析失败: {str(e)}")
-            raise
+    def finish(self) -> List[Segment]:
+        """回复结束，返回剩余的分段"""
+        segments = []
+        if self._partial:
+            segment = self.feed_line(self._partial)
+            if segment:
+                segments.append(segment)
+            self._partial = ""
+        segment = self._close_block()
+        if segment:
+            segments.append(segment)
+        return segments
 
-    @staticmethod
-    def save_segments(segments: List[Segment], output_file: str) -> None:
+
+def parse_analysis_lines(lines: Iterable[str]) -> Iterator[Tuple[int, Segment]]:
+    """
+    单次线性扫描 .txt 分析结果，返回每个完整回复中的 (回复序号, 分段)
+    文件由多个字幕块的回复依次追加而成：时间基准行(紧凑模式) -> 完整回复标题 -> 回复 -> 用量，
+    旧版本文件在回复之前还有思考过程，不属于任何完整回复的行一律跳过
+    """
+    origin_ms: Optional[int] = None
+    extractor: Optional[SegmentExtractor] = None
+    chunk_id = -1
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith(SEPARATOR):
+            if extractor:
+                yield from ((chunk_id, segment) for segment in extractor.finish())
+                extractor = None
+            if line == RESPONSE_HEADER:
+                chunk_id += 1
+                extractor = SegmentExtractor(origin_ms)
+                origin_ms = None
+            continue
+        if line.startswith(TIME_BASE_MARKER) or line == USAGE_HEADER:
+            if extractor:
+                yield from ((chunk_id, segment) for segment in extractor.finish())
+                extractor = None
+            if line.startswith(TIME_BASE_MARKER):
+                origin_ms = parse_srt_time(line[len(TIME_BASE_MARKER):])
+            continue
+        if extractor:
+            segment = extractor.feed_line(line)
+            if segment:
+                yield chunk_id, segment
+
+    if extractor:
+        yield from ((chunk_id, segment) for segment in extractor.finish())
+    if chunk_id < 0:
+        logger.warning("未找到完整回复部分")
+
+
+def parse_analysis_records(lines: Iterable[str]) -> Iterator[Tuple[int, Segment]]:
+    """逐行解析 AnalysisSink 写入的 .jsonl，返回每条回复中的 (字幕块序号, 分段)"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
         try:
-            # 获取视频名称
-            name, _ = os.path.splitext(os.path.basename(output_file))
-            
-            # 构建JSON结构
-            result = {
-                "video_name": name,
-                "total_segments": len(segments),
-                "segments": [asdict(segment) for segment in segments]
-            }
-
-            # 确保输出文件使用.json扩展名
-            json_file = f"{os.path.splitext(output_file)[0]}.json"
-            
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            logger.info(f"分段信息已保存至: {json_file}")
-        except Exception as e:
-            logger.error(f"保存失败: {str(e)}")
-            raise
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            # 写入时被中断的最后一行
+            logger.warning(f"跳过无法解析的分析记录: 第{number}行, 错误: {str(e)}")
+            continue
+        extractor = SegmentExtractor(record.get("origin_ms"))
+        segments = extractor.feed(record.get("answer") or "")
+        segments.extend(extractor.finish())
+        for segment in segments:
+            yield record.get("chunk_id", number - 1), segment
 
 
-def process_ai_response(input_file: str, output_file: str) -> None:
-    try:
-        # 读取AI回答文件
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+def iter_analysis_segments(input_file: str, buffer_size: int = 1 << 20) -> Iterator[Tuple[int, Segment]]:
+    """
+    流式读取分析结果文件(.txt 或 .jsonl)，按文件顺序返回所有回复中的 (字幕块序号, 分段)
+    文件逐行读取，内存中只保留当前分段，几MB的结果文件也是一次线性扫描
+    """
+    parse = parse_analysis_records if input_file.endswith('.jsonl') else parse_analysis_lines
+    with open(input_file, 'r', encoding='utf-8', errors='replace', buffering=buffer_size) as f:
+        yield from parse(f)
+
 
+def process_ai_response(input_file: str, output_file: Optional[str] = None) -> None:
+    """
+    解析分析结果文件，去重后写入分段目录
+    output_file: 导出的分段JSON路径，给出时总是导出；未给出时按配置导出到 <名称>_segments.json
+    """
+    try:
         # 获取输出文件名（不含扩展名）
         output_name = os.path.splitext(input_file)[0]
-        
-        # 解析分段信息
-        parser = SegmentParser()
-        segments = parser.parse_segments(content)
 
-        # 保存结构化数据
-        parser.save_segments(segments, f"{output_name}_segments")
+        # 流式解析所有回复中的分段
+        segments = [segment for _, segment in iter_analysis_segments(input_file)]
+        if not segments:
+            logger.warning("未找到任何有效分段")
+        # 相邻字幕块在重叠处给出的重复分段只保留一个
+        segments = dedupe_segments(segments)
+
+        # 写入分段目录，按配置从分段目录导出原有格式的JSON，录像名与 main 中一致
+        video_name = os.path.basename(output_name)
+        catalog = SegmentCatalog()
+        catalog.add_segments(video_name, segments, replace=True)
+        if output_file or SEGMENT_CATALOG_SETTINGS["export_json"]:
+            catalog.export_json(video_name, output_file or f"{output_name}_segments.json")
 
     except Exception as e:
         logger.error(f"处理失败: {str(e)}")
@@ -122,5 +264,5 @@ def process_ai_response(input_file: str, output_file: str) -> None:
 
 if __name__ == "__main__":
     input_file = "20250314-150450-812-升哥下午茶.txt"
-    output_file = "segments.txt"
+    output_file = "20250314-150450-812-升哥下午茶_segments.json"
     process_ai_response(input_file, output_file)
@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+from array import array
+from typing import List, Tuple, Type, TypeVar
+
+from logger import setup_logger
+
+logger = setup_logger('sidecar')
+
+T = TypeVar('T')
+
+
+def is_current(video_path: str, size: int, mtime_ns: int) -> bool:
+    """视频文件的大小和修改时间是否与建立索引时一致"""
+    try:
+        stat = os.stat(video_path)
+    except OSError:
+        return False
+    return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+
+def save_sidecar(index_path: str, version: int, size: int, mtime_ns: int, meta: dict,
+                 arrays: List[array]) -> None:
+    """
+    保存索引文件：第一行是JSON头部，之后依次是长度相同的各个数组
+    meta: 需要保存在头部的其他信息，如流信息或检测参数
+    """
+    header = {
+        "version": version,
+        "byteorder": sys.byteorder,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        **meta,
+        "count": len(arrays[0]),
+    }
+    # 先写临时文件再替换，避免中断时留下损坏的索引
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+        for values in arrays:
+            values.tofile(f)
+    os.replace(tmp_path, index_path)
+
+
+def load_sidecar(index_path: str, version: int, typecodes: str) -> Tuple[dict, List[array]]:
+    """读取 save_sidecar 保存的索引文件，typecodes 为各数组的类型码，返回 (头部, 数组列表)"""
+    with open(index_path, 'rb') as f:
+        header = json.loads(f.readline().decode('utf-8'))
+        if header.get("version") != version:
+            raise ValueError(f"索引版本不匹配: {header.get('version')}")
+        arrays = []
+        for typecode in typecodes:
+            values = array(typecode)
+            values.fromfile(f, header["count"])
+            arrays.append(values)
+    if header["byteorder"] != sys.byteorder:
+        for values in arrays:
+            values.byteswap()
+    return header, arrays
+
+
+def load_or_build(cls: Type[T], video_path: str, index_path: str, label: str, rebuild: bool = False) -> T:
+    """
+    读取视频旁边的索引，索引不存在、损坏或已过期时重新建立并保存
+    cls 需要提供 load(video_path, index_path)、build(video_path)、is_valid() 和 save(index_path)
+    label: 日志中的索引名称
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+
+    if not rebuild and os.path.exists(index_path):
+        try:
+            index = cls.load(video_path, index_path)
+            if index.is_valid():
+                return index
+            logger.info(f"{label}已过期，重新建立: {video_path}")
+        except Exception as e:
+            logger.warning(f"{label}读取失败，重新建立: {index_path}, 错误: {str(e)}")
+
+    index = cls.build(video_path)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        # 录像目录只读时仍然可以使用内存中的索引
+        logger.warning(f"{label}保存失败: {index_path}, 错误: {str(e)}")
+    return index
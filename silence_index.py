@@ -0,0 +1,172 @@
+import os
+import subprocess
+import tempfile
+from array import array
+from bisect import bisect_right
+from typing import Optional, Tuple
+
+import numpy as np
+
+from config import CUT_SETTINGS, SILENCE_SETTINGS
+from logger import setup_logger
+from sidecar import is_current, load_or_build, load_sidecar, save_sidecar
+
+logger = setup_logger('silence_index')
+
+# 索引文件格式版本，格式变化时递增使旧索引失效
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".sil"
+
+# 每次从ffmpeg读取的窗口数，内存占用与音频总长度无关
+_BLOCK_WINDOWS = 4096
+
+
+def _analysis_params() -> dict:
+    """影响静音检测结果的参数，参数变化后旧索引失效"""
+    return {key: SILENCE_SETTINGS[key] for key in ("sample_rate", "window_ms", "threshold_db", "min_silence_ms")}
+
+
+class SilenceIndex:
+    """
+    源视频音轨的静音区间索引：区间起止时间按时间升序存放在数组中，查找为二分
+    索引以 <视频文件名>.sil 的形式保存在视频旁边，视频大小、修改时间或检测参数变化后自动失效
+    """
+
+    def __init__(self, video_path: str, size: int, mtime_ns: int, params: dict, starts: array, ends: array):
+        self.video_path = video_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.params = params
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, video_path: str) -> "SilenceIndex":
+        """
+        解码一次音轨为低采样率单声道PCM，按固定窗口计算RMS能量，连续低能量的窗口合并为静音区间
+        PCM从管道中分块读取，10小时的音频也只占用固定大小的内存
+        """
+        stat = os.stat(video_path)
+        params = _analysis_params()
+        window = params["sample_rate"] * params["window_ms"] // 1000
+        window_seconds = params["window_ms"] / 1000
+        # dBFS阈值换算为16位采样的均方值，比较时不必开方和取对数
+        threshold = (32768 * 10 ** (params["threshold_db"] / 20)) ** 2
+        min_windows = max(1, -(-params["min_silence_ms"] // params["window_ms"]))
+
+        command = [
+            CUT_SETTINGS["ffmpeg_path"], "-hide_banner", "-loglevel", "error",
+            "-i", video_path, "-vn", "-ac", "1", "-ar", str(params["sample_rate"]),
+            "-f", "s16le", "-acodec", "pcm_s16le", "-"
+        ]
+        # 错误输出写到临时文件，只读取标准输出时错误输出的管道写满会让ffmpeg卡住
+        stderr = tempfile.TemporaryFile()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        starts = array('d')
+        ends = array('d')
+        # 跨块延续的静音从第几个窗口开始，None 表示当前不在静音中
+        run_start: Optional[int] = None
+        position = 0
+        remainder = b""
+        block_bytes = window * _BLOCK_WINDOWS * 2
+
+        def close_run(run_end: int) -> None:
+            if run_end - run_start >= min_windows:
+                starts.append(run_start * window_seconds)
+                ends.append(run_end * window_seconds)
+
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                data = remainder + data
+                usable = len(data) // (window * 2) * window * 2
+                remainder = data[usable:]
+                if not usable:
+                    continue
+                samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32).reshape(-1, window)
+                silent = np.mean(samples * samples, axis=1) < threshold
+
+                # 静音状态变化的位置，块首按上一块的状态补齐
+                padded = np.concatenate(([run_start is not None], silent, [False]))
+                changes = np.flatnonzero(padded[1:] != padded[:-1])
+                for change in changes:
+                    if change == len(silent):
+                        break
+                    if silent[change]:
+                        run_start = position + int(change)
+                    else:
+                        close_run(position + int(change))
+                        run_start = None
+                position += len(silent)
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"ffmpeg执行失败: {stderr.read().decode('utf-8', errors='replace').strip()}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            stderr.close()
+
+        if run_start is not None:
+            close_run(position)
+        logger.info(f"静音索引建立完成: {video_path}, 共 {len(starts)} 段静音, "
+                    f"音频时长 {position * window_seconds:.1f}s")
+        return cls(video_path, stat.st_size, stat.st_mtime_ns, params, starts, ends)
+
+    def is_valid(self) -> bool:
+        return is_current(self.video_path, self.size, self.mtime_ns) and self.params == _analysis_params()
+
+    def save(self, index_path: str) -> None:
+        save_sidecar(index_path, INDEX_VERSION, self.size, self.mtime_ns, {"params": self.params},
+                     [self.starts, self.ends])
+
+    @classmethod
+    def load(cls, video_path: str, index_path: str) -> "SilenceIndex":
+        header, (starts, ends) = load_sidecar(index_path, INDEX_VERSION, 'dd')
+        return cls(video_path, header["size"], header["mtime_ns"], header["params"], starts, ends)
+
+    def nearest(self, time_point: float) -> Optional[Tuple[float, float]]:
+        """离指定时间最近的静音区间，时间在静音中时返回所在区间"""
+        i = bisect_right(self.starts, time_point)
+        candidates = []
+        if i:
+            candidates.append((self.starts[i - 1], self.ends[i - 1]))
+        if i < len(self.starts):
+            candidates.append((self.starts[i], self.ends[i]))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda interval: max(interval[0] - time_point, time_point - interval[1], 0))
+
+    def snap(self, time_point: float, tolerance: Optional[float] = None, padding: Optional[float] = None) -> float:
+        """
+        将时间点对齐到最近的静音中，与静音边缘保持 padding 秒的距离
+        tolerance 内没有静音时返回原时间
+        """
+        tolerance = SILENCE_SETTINGS["snap_tolerance"] if tolerance is None else tolerance
+        padding = SILENCE_SETTINGS["padding"] if padding is None else padding
+        interval = self.nearest(time_point)
+        if interval is None:
+            return time_point
+        start, end = interval
+        if end - start <= padding * 2:
+            low = high = (start + end) / 2
+        else:
+            low, high = start + padding, end - padding
+        snapped = min(max(time_point, low), high)
+        if abs(snapped - time_point) > tolerance:
+            return time_point
+        return snapped
+
+
+def index_path_for(video_path: str) -> str:
+    return f"{video_path}{INDEX_SUFFIX}"
+
+
+def load_silence_index(video_path: str, rebuild: bool = False) -> SilenceIndex:
+    """读取视频旁边的静音索引，索引不存在、损坏或已过期(包括检测参数变化)时重新分析并保存"""
+    return load_or_build(SilenceIndex, video_path, index_path_for(video_path), "静音索引", rebuild)
@@ -0,0 +1,121 @@
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Iterator, List, Optional
+
+from timecode import format_srt_time
+
+# 时间行，允许小时超过两位、毫秒用逗号或点分隔，以及行尾的坐标等附加信息
+TIME_PATTERN = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+
+
+def _to_ms(hours: str, minutes: str, seconds: str, milliseconds: str) -> int:
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(milliseconds.ljust(3, '0'))
+
+
+class Cue:
+    """单条字幕，时间为整数毫秒；使用 __slots__，几十万条字幕也只占很少内存"""
+
+    __slots__ = ('index', 'start_ms', 'end_ms', 'text')
+
+    def __init__(self, index: int, start_ms: int, end_ms: int, text: str):
+        self.index = index
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"Cue({self.index}, {self.start_ms}, {self.end_ms}, {self.text!r})"
+
+
+def iter_cues(srt_file: str, encoding: str = 'utf-8-sig', buffer_size: int = 1 << 20) -> Iterator[Cue]:
+    """
+    逐条读取SRT字幕，不把整个文件载入内存
+    utf-8-sig 去掉开头的BOM，通用换行模式同时处理 LF/CRLF/CR；
+    字幕之间缺少空行时，遇到"序号+时间行"也会开始新的字幕
+    """
+    index: Optional[int] = None
+    start_ms = end_ms = None
+    text_lines: List[str] = []
+    previous = ""
+    count = 0
+
+    with open(srt_file, 'r', encoding=encoding, errors='replace', buffering=buffer_size) as f:
+        for line in f:
+            line = line.rstrip()
+            if not line:
+                if start_ms is not None:
+                    yield Cue(index if index is not None else count + 1, start_ms, end_ms, "\n".join(text_lines))
+                    count += 1
+                    index, start_ms, text_lines = None, None, []
+                previous = ""
+                continue
+
+            match = TIME_PATTERN.search(line) if '-->' in line else None
+            if match:
+                if start_ms is not None:
+                    # 缺少空行分隔，上一行的序号属于新字幕
+                    if text_lines and text_lines[-1].isdigit():
+                        text_lines.pop()
+                    yield Cue(index if index is not None else count + 1, start_ms, end_ms, "\n".join(text_lines))
+                    count += 1
+                    text_lines = []
+                index = int(previous) if previous.isdigit() else None
+                start_ms, end_ms = _to_ms(*match.group(1, 2, 3, 4)), _to_ms(*match.group(5, 6, 7, 8))
+            elif start_ms is not None:
+                text_lines.append(line)
+            previous = line.lstrip('\ufeff').strip()
+
+        if start_ms is not None:
+            yield Cue(index if index is not None else count + 1, start_ms, end_ms, "\n".join(text_lines))
+
+
+def write_synthetic_srt(path: str, count: int) -> None:
+    """生成 count 条字幕的测试文件，每20条字幕后有一段3秒的停顿"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        start = 0
+        for i in range(count):
+            f.write(f"{i + 1}\n{format_srt_time(start)} --> {format_srt_time(start + 1800)}\n"
+                    f"第{i}句字幕 subtitle line number {i}\n\n")
+            start += 5000 if i % 20 == 19 else 2000
+
+
+def _measure(name: str, func) -> None:
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} 字幕 {result:>8}  耗时 {elapsed:7.2f}s  峰值内存 {peak / 1024 / 1024:8.1f}MB")
+
+
+def benchmark(count: int = 500000) -> None:
+    """生成 count 条字幕的SRT文件，对比 pysrt.open 和 iter_cues 的耗时与峰值内存"""
+    fd, path = tempfile.mkstemp(suffix='.srt')
+    os.close(fd)
+    try:
+        write_synthetic_srt(path, count)
+        print(f"测试文件: {count} 条字幕, {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+        try:
+            import pysrt
+            _measure("pysrt.open", lambda: len(pysrt.open(path, encoding='utf-8')))
+        except ImportError:
+            print("未安装pysrt，跳过对比")
+        _measure("iter_cues", lambda: sum(1 for _ in iter_cues(path)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SRT读取性能测试')
+    parser.add_argument('--cues', type=int, default=500000, help='测试文件的字幕条数')
+    benchmark(parser.parse_args().cues)
@@ -0,0 +1,61 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+from logger import setup_logger
+from srt_reader import iter_cues
+from timecode import format_srt_time
+
+logger = setup_logger('subtitle_index')
+
+Cue = Tuple[int, int, str]
+
+
+class SrtRangeIndex:
+    """
+    字幕时间范围索引：字幕按开始时间排序后存放在数组中，按时间范围切片时二分查找，
+    不需要对每个切片线性扫描整个字幕文件
+    """
+
+    def __init__(self, cues: List[Cue]):
+        cues = sorted(cues)
+        self.starts = array('q', (start for start, _, _ in cues))
+        self.ends = array('q', (end for _, end, _ in cues))
+        self.texts = [text for _, _, text in cues]
+        # 结束时间的前缀最大值单调不减，用于二分找到第一条可能与范围重叠的字幕
+        self.max_ends = array('q')
+        running = 0
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_file(cls, srt_file: str) -> "SrtRangeIndex":
+        index = cls([(cue.start_ms, cue.end_ms, cue.text) for cue in iter_cues(srt_file)])
+        logger.info(f"字幕索引建立完成: {srt_file}, 共 {len(index)} 条字幕")
+        return index
+
+    def cues_between(self, start_ms: int, end_ms: int) -> List[Cue]:
+        """
+        返回与 [start_ms, end_ms) 重叠的字幕，时间平移到以 start_ms 为起点并裁剪到范围内
+        """
+        lo = bisect_right(self.max_ends, start_ms)
+        hi = bisect_left(self.starts, end_ms)
+        cues = []
+        for i in range(lo, hi):
+            if self.ends[i] <= start_ms:
+                continue
+            cue_start = max(self.starts[i], start_ms) - start_ms
+            cue_end = min(self.ends[i], end_ms) - start_ms
+            cues.append((cue_start, cue_end, self.texts[i]))
+        return cues
+
+    def render_srt(self, start_ms: int, end_ms: int) -> str:
+        """把范围内的字幕渲染为以切片起点为零点的SRT文本"""
+        blocks = []
+        for i, (cue_start, cue_end, text) in enumerate(self.cues_between(start_ms, end_ms), start=1):
+            blocks.append(f"{i}\n{format_srt_time(cue_start)} --> {format_srt_time(cue_end)}\n{text}\n")
+        return "\n".join(blocks)
@@ -1,27 +1,38 @@
+import asyncio
 import os.path
-from dataclasses import dataclass
-from typing import Generator, List, Iterator
+from typing import Awaitable, Callable, Iterable, List, Iterator, Optional, Tuple
 
-import pysrt
 from collections import deque
+from itertools import islice
+
+from analysis_runner import AnalysisChunk, AnalysisRunner
+from analysis_sink import AnalysisSink, QwenResponse
+from config import ANALYSIS_SETTINGS
+from danmaku import DanmakuDensity, danmaku_path_for
+from llm_client import aclose_clients
+from logger import setup_logger
 from qwen import Qwen
+from segment_parser import Segment
+from srt_reader import Cue, iter_cues
+from timecode import TIME_BASE_MARKER, format_srt_time
+
+logger = setup_logger('subtitle_process')
 
+# 按弹幕密度筛选或排序字幕的方式
+DANMAKU_MODES = ("off", "order", "filter")
 
-@dataclass
-class SubtitleSegment:
-    start_time: str
-    end_time: str
-    title: str
-    content: str
+# 紧凑时间戳模式下附在字幕块开头的说明，要求模型按相同格式返回时间
+COMPACT_TIME_HINT = "以下字幕时间为相对时间基准的秒数(如 +12.34)，返回分段时间时请使用相同的写法，如 [+12.34] --> [+95.06]"
 
 
-def read_subtitle_chunks(srt_file: str, chunk_size: int = 500, overlap: int = 10) -> Iterator[List[pysrt.SubRipItem]]:
-    subs = pysrt.open(srt_file)
-    total_subs = len(subs)
+def read_subtitle_chunks(srt_file: str, chunk_size: int = 500, overlap: int = 10) -> Iterator[List[Cue]]:
+    cues = iter_cues(srt_file)
     context_buffer = deque(maxlen=overlap)
 
-    for i in range(0, total_subs, chunk_size):
-        current_chunk = subs[i:min(i + chunk_size, total_subs)]
+    while True:
+        current_chunk = list(islice(cues, chunk_size))
+        if not current_chunk:
+            break
         # 合并上下文和当前块
         context_chunk = list(context_buffer) + current_chunk
         # 更新上下文缓存
@@ -29,13 +40,180 @@ def read_subtitle_chunks(srt_file: str, chunk_size: int = 500, overlap: int = 10
         yield context_chunk
 
 
-def process_subtitle_segments(srt_file: str) -> None:
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约每字一个token，其他字符约每4个一个token"""
+    cjk = sum(1 for char in text if '\u3000' <= char <= '\u9fff' or '\uff00' <= char <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def format_cue(cue: Cue, origin_ms: Optional[int] = None) -> str:
+    """
+    渲染单条字幕，给出 origin_ms 时使用相对该时间的秒数，写法与要求模型返回的时间相同
+    相对秒数保留两位小数，还原后与原始时间相差不超过5毫秒
+    """
+    if origin_ms is None:
+        return f"[{format_srt_time(cue.start_ms)} --> {format_srt_time(cue.end_ms)}] {cue.text}"
+    return f"[{(cue.start_ms - origin_ms) / 1000:+.2f} --> {(cue.end_ms - origin_ms) / 1000:+.2f}] {cue.text}"
+
+
+def format_chunk(chunk: List[Cue], compact: bool = False) -> str:
+    if not compact:
+        return " ".join(format_cue(cue) for cue in chunk)
+    origin_ms = chunk[0].start_ms
+    header = f"{TIME_BASE_MARKER}{format_srt_time(origin_ms)}。{COMPACT_TIME_HINT}"
+    return header + "\n" + " ".join(format_cue(cue, origin_ms) for cue in chunk)
+
+
+def read_subtitle_chunks_by_budget(srt_file: str, token_budget: int, overlap: int = 10,
+                                   silence_gap_ms: int = 2000,
+                                   compact: bool = False) -> Iterator[List[Cue]]:
+    """
+    按token预算切分字幕块
+    字幕块达到预算的80%后遇到超过 silence_gap_ms 的停顿即断开；
+    直到预算用完都没有足够长的停顿时，在最后20%范围内停顿最长的位置断开
+    字幕逐条读取，内存中只保留当前字幕块和重叠部分
+    """
+    return chunk_cues(iter_cues(srt_file), token_budget, overlap, silence_gap_ms, compact)
+
+
+def cues_in_spans(cues: Iterable[Cue], spans: List[Tuple[int, int]]) -> Iterator[List[Cue]]:
+    """按时间段分组字幕，spans 为按时间排序的 (开始毫秒, 结束毫秒)，不在任何时间段内的字幕丢弃"""
+    spans = iter(spans)
+    span = next(spans, None)
+    group = []
+    for cue in cues:
+        while span and cue.start_ms >= span[1]:
+            if group:
+                yield group
+                group = []
+            span = next(spans, None)
+        if not span:
+            break
+        if cue.start_ms >= span[0]:
+            group.append(cue)
+    if group:
+        yield group
+
+
+def chunk_cues(cues: Iterable[Cue], token_budget: int, overlap: int = 10, silence_gap_ms: int = 2000,
+               compact: bool = False) -> Iterator[List[Cue]]:
+    """按token预算切分字幕块，规则见 read_subtitle_chunks_by_budget"""
+    cues = iter(cues)
+    # 已读取但还未放入字幕块的字幕，断点回退时退回的字幕也放在这里
+    pending = deque()
+
+    def peek() -> Optional[Cue]:
+        if not pending:
+            cue = next(cues, None)
+            if cue is None:
+                return None
+            pending.append(cue)
+        return pending[0]
+
+    soft_limit = token_budget * 0.8
+    context = []
+
+    while peek() is not None:
+        origin_ms = pending[0].start_ms if compact else None
+        tokens = sum(estimate_tokens(format_cue(cue, origin_ms)) for cue in context)
+        current_chunk = []
+        best_break, best_gap = None, -1
+        while peek() is not None:
+            cost = estimate_tokens(format_cue(pending[0], origin_ms))
+            if current_chunk and tokens + cost > token_budget:
+                # 预算用完，退回到已经看到的最长停顿处
+                if best_break is not None:
+                    pending.extendleft(reversed(current_chunk[best_break:]))
+                    del current_chunk[best_break:]
+                break
+            tokens += cost
+            current_chunk.append(pending.popleft())
+            following = peek()
+            if tokens >= soft_limit and following is not None:
+                gap = following.start_ms - current_chunk[-1].end_ms
+                if gap >= silence_gap_ms:
+                    break
+                if gap > best_gap:
+                    best_break, best_gap = len(current_chunk), gap
+
+        # 合并上下文和当前块
+        yield context + current_chunk
+        context = current_chunk[-overlap:] if overlap else []
+
+
+async def analyze_subtitle_segments(srt_file: str, token_budget: Optional[int] = None,
+                                    compact: Optional[bool] = None, concurrency: Optional[int] = None,
+                                    use_cache: Optional[bool] = None,
+                                    on_segment: Optional[Callable[[Segment], Awaitable[None]]] = None,
+                                    danmaku_mode: Optional[str] = None, danmaku_file: Optional[str] = None) -> None:
+    """
+    并发分析所有字幕块，结果按字幕块顺序追加到 <名称>.jsonl(及 <名称>.txt)
+    use_cache: 是否使用回复缓存，False 时强制重新请求
+    on_segment: 回复仍在生成时，每解析出一个完整分段即调用并等待其完成，可以据此提前开始切割
+    danmaku_mode: 按弹幕密度筛选或排序字幕，off: 不使用; order: 弹幕密集的字幕块优先分析;
+                  filter: 只分析弹幕最密集的时间段。未指定时使用配置
+    danmaku_file: 弹幕XML文件，未指定时使用字幕旁边的同名 .xml
+    """
     full_name = os.path.basename(srt_file)
     name, *_ = os.path.splitext(full_name)
-    qwen = Qwen(name)
-    
-    for chunk in read_subtitle_chunks(srt_file, chunk_size=700):
-        # 将字幕块转换为文本
-        chunk_text = " ".join([f"[{sub.start} --> {sub.end}] {sub.text}" for sub in chunk])
-        # 调用通义千问进行主题分析
-        qwen.req_qwen(chunk_text)
+    token_budget = token_budget or ANALYSIS_SETTINGS["chunk_token_budget"]
+    if compact is None:
+        compact = ANALYSIS_SETTINGS["compact_timestamps"]
+    danmaku_mode = danmaku_mode or ANALYSIS_SETTINGS["danmaku_mode"]
+    if danmaku_mode not in DANMAKU_MODES:
+        raise ValueError(f"不支持的弹幕模式: {danmaku_mode}")
+
+    density = None
+    if danmaku_mode != "off":
+        danmaku_file = danmaku_file or danmaku_path_for(srt_file)
+        if danmaku_file:
+            density = await asyncio.get_running_loop().run_in_executor(None, DanmakuDensity.from_file, danmaku_file)
+        if not density or not density.total:
+            logger.info(f"没有可用的弹幕，分析全部字幕: {srt_file}")
+            density = None
+
+    overlap, silence_gap_ms = ANALYSIS_SETTINGS["chunk_overlap"], ANALYSIS_SETTINGS["silence_gap_ms"]
+    if density and danmaku_mode == "filter":
+        # 只把弹幕最密集的时间段交给大模型，每个时间段单独分块
+        spans = density.top_spans(ANALYSIS_SETTINGS["danmaku_window"], ANALYSIS_SETTINGS["danmaku_top_ratio"])
+        logger.info(f"按弹幕密度选出 {len(spans)} 个时间段: {srt_file}")
+        subtitle_chunks = (chunk for group in cues_in_spans(iter_cues(srt_file), spans)
+                           for chunk in chunk_cues(group, token_budget, overlap, silence_gap_ms, compact))
+    else:
+        subtitle_chunks = read_subtitle_chunks_by_budget(srt_file, token_budget, overlap, silence_gap_ms, compact)
+
+    chunks = []
+    for chunk in subtitle_chunks:
+        # 将字幕块转换为文本，紧凑模式下记录时间基准以便解析时还原绝对时间
+        chunk_text = format_chunk(chunk, compact)
+        chunks.append(AnalysisChunk(len(chunks), chunk_text, estimate_tokens(chunk_text),
+                                    chunk[0].start_ms if compact else None,
+                                    chunk[0].start_ms, chunk[-1].end_ms))
+    # 弹幕密集的字幕块先请求，结果仍按字幕块顺序写入
+    priorities = [density.score(chunk.start_ms, chunk.end_ms) for chunk in chunks] if density else None
+
+    # 结果写入 <名称>.jsonl，并按配置同时渲染 <名称>.txt
+    with AnalysisSink(name, render_txt=ANALYSIS_SETTINGS["render_txt"]) as sink:
+        async def write_result(analysis_chunk: AnalysisChunk, response: QwenResponse) -> None:
+            sink.write(response, analysis_chunk.index, analysis_chunk.origin_ms,
+                       analysis_chunk.start_ms, analysis_chunk.end_ms)
+
+        await AnalysisRunner(Qwen(name, use_cache), concurrency).run(
+            chunks, write_result, (lambda _, segment: on_segment(segment)) if on_segment else None, priorities
+        )
+
+
+def process_subtitle_segments(srt_file: str, token_budget: Optional[int] = None,
+                              compact: Optional[bool] = None, concurrency: Optional[int] = None,
+                              use_cache: Optional[bool] = None,
+                              on_segment: Optional[Callable[[Segment], Awaitable[None]]] = None,
+                              danmaku_mode: Optional[str] = None) -> None:
+    async def run() -> None:
+        try:
+            await analyze_subtitle_segments(srt_file, token_budget, compact, concurrency, use_cache, on_segment,
+                                            danmaku_mode)
+        finally:
+            # 事件循环随 asyncio.run 结束，连接池需要在此之前关闭
+            await aclose_clients()
+
+    asyncio.run(run())
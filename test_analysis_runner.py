@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+openai = pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("numpy")
+
+from analysis_runner import AnalysisChunk, AnalysisRunner, RateLimiter  # noqa: E402
+from config import QWEN_CONFIG  # noqa: E402
+from llm_client import aclose_clients  # noqa: E402
+from llm_stub import StubLLMServer  # noqa: E402
+from qwen import Qwen  # noqa: E402
+from srt_reader import Cue  # noqa: E402
+from subtitle_process import estimate_tokens, format_chunk  # noqa: E402
+from timecode import format_srt_time  # noqa: E402
+
+
+def _elapsed(coroutine) -> float:
+    started = time.monotonic()
+    asyncio.run(coroutine)
+    return time.monotonic() - started
+
+
+def test_rate_limiter_waits_for_token_budget():
+    async def acquire():
+        limiter = RateLimiter(tokens_per_minute=60000)
+        await limiter.acquire(60000)
+        # 每秒补充1000个token
+        await limiter.acquire(500)
+
+    assert _elapsed(acquire()) >= 0.45
+
+
+def test_rate_limiter_spaces_requests():
+    async def acquire():
+        limiter = RateLimiter(requests_per_minute=600)
+        for _ in range(601):
+            await limiter.acquire()
+
+    assert _elapsed(acquire()) >= 0.09
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # 模拟服务运行在本地，不访问网络
+    with StubLLMServer(seed=0) as server:
+        monkeypatch.setitem(QWEN_CONFIG, "base_url", server.base_url)
+        monkeypatch.setitem(QWEN_CONFIG, "api_key", "stub")
+        yield server
+
+
+def _chunks(count: int) -> list:
+    chunks = []
+    for i in range(count):
+        cues = [Cue(j + 1, (i * 10 + j) * 2000, (i * 10 + j) * 2000 + 1800, f"第{j}句字幕") for j in range(10)]
+        text = format_chunk(cues)
+        chunks.append(AnalysisChunk(i, text, estimate_tokens(text), start_ms=cues[0].start_ms))
+    return chunks
+
+
+def _runner(**kwargs) -> AnalysisRunner:
+    return AnalysisRunner(Qwen("测试", use_cache=False), requests_per_minute=0, retry_backoff=0.01, **kwargs)
+
+
+def _run(runner: AnalysisRunner, chunks: list, **kwargs) -> list:
+    async def run():
+        try:
+            return await runner.run(chunks, **kwargs)
+        finally:
+            await aclose_clients()
+
+    return asyncio.run(run())
+
+
+def test_retries_until_success(stub):
+    failures = iter([True, True])
+    stub._should_fail = lambda: next(failures, False)
+    segments = []
+
+    async def on_segment(chunk, segment):
+        segments.append(segment)
+
+    responses = _run(_runner(concurrency=1, max_retries=2), _chunks(1), on_segment=on_segment)
+    assert (stub.stats.requests, stub.stats.errors) == (3, 2)
+    assert "分段1：" in responses[0].answer_content
+    assert len(segments) == stub.segments_per_request
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.error_rate = 1.0
+    with pytest.raises(openai.RateLimitError):
+        _run(_runner(max_retries=1), _chunks(1))
+    assert stub.stats.requests == 2
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.error_rate, stub.error_status = 1.0, 400
+    with pytest.raises(openai.BadRequestError):
+        _run(_runner(max_retries=3), _chunks(1))
+    assert stub.stats.requests == 1
+
+
+def test_results_follow_chunk_order_despite_priorities(stub):
+    chunks = _chunks(4)
+    results = []
+
+    async def on_result(chunk, response):
+        results.append(chunk.index)
+
+    responses = _run(_runner(concurrency=2), chunks, on_result=on_result, priorities=[0, 1, 2, 3])
+    assert results == [0, 1, 2, 3]
+    for chunk, response in zip(chunks, responses):
+        assert f"[{format_srt_time(chunk.start_ms)}]" in response.answer_content
@@ -0,0 +1,64 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from config import CUT_SETTINGS
+
+if not (shutil.which(CUT_SETTINGS["ffmpeg_path"]) and shutil.which(CUT_SETTINGS["ffprobe_path"])):
+    pytest.skip("需要 ffmpeg 和 ffprobe", allow_module_level=True)
+pytest.importorskip("moviepy")
+
+from cuter import VideoSource, _cut_smart  # noqa: E402
+
+# 测试视频每4秒一个关键帧
+FPS = 25
+GOP_SECONDS = 4
+
+
+@pytest.fixture(scope="module")
+def source_video(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp("source") / "testsrc.mp4")
+    subprocess.run([
+        CUT_SETTINGS["ffmpeg_path"], "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=duration=12:size=320x240:rate={FPS}",
+        "-f", "lavfi", "-i", "sine=frequency=440:duration=12",
+        "-c:v", "libx264", "-g", str(FPS * GOP_SECONDS), "-keyint_min", str(FPS * GOP_SECONDS),
+        "-sc_threshold", "0", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        path
+    ], check=True)
+    return path
+
+
+def _probe(path: str) -> tuple:
+    output = subprocess.run([
+        CUT_SETTINGS["ffprobe_path"], "-v", "error",
+        "-select_streams", "v:0",
+        "-read_intervals", "%+#1",
+        "-show_entries", "format=duration:packet=pts_time",
+        "-of", "json",
+        path
+    ], capture_output=True, text=True, check=True).stdout
+    data = json.loads(output)
+    return float(data["format"]["duration"]), float(data["packets"][0]["pts_time"])
+
+
+@pytest.mark.parametrize("start_time, end_time", [
+    (1.5, 9.3),  # 首尾GOP重编码，中间 [4, 8) 流复制
+    (4.0, 11.0),  # 起点正好是关键帧
+    (5.2, 7.6),  # 片段内没有完整的GOP，整段重编码
+])
+def test_smart_cut_matches_requested_range(source_video, tmp_path, start_time, end_time):
+    output_file = str(tmp_path / "clip.mp4")
+    source = VideoSource(source_video)
+    try:
+        _cut_smart(start_time, end_time, source, output_file)
+    finally:
+        source.close()
+
+    duration, first_pts = _probe(output_file)
+    frame = 1 / FPS
+    assert abs(duration - (end_time - start_time)) <= 2 * frame
+    assert abs(first_pts) <= frame
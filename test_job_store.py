@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from job_store import (
+    JobStore, RECORDING_ANALYZED, RECORDING_DONE, RECORDING_PENDING, SEGMENT_CUT, SEGMENT_PENDING,
+    SEGMENT_UPLOADED, segment_key, split_segment_key
+)
+
+
+@pytest.fixture
+def store(tmp_path) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+@pytest.fixture
+def srt_path(tmp_path) -> str:
+    path = tmp_path / "录像.srt"
+    path.write_text("1\n00:00:00,000 --> 00:00:01,000\n字幕\n", encoding="utf-8")
+    return str(path)
+
+
+def test_segment_key_round_trip():
+    key = segment_key("00:00:01,000", "00:03:00,500")
+    assert split_segment_key(key) == ("00:00:01,000", "00:03:00,500")
+
+
+def test_segment_stages_advance(store, srt_path):
+    assert store.open_recording("录像", srt_path) == RECORDING_PENDING
+    key = segment_key("00:00:01,000", "00:00:09,000")
+    assert store.add_segment("录像", key, "标题") == SEGMENT_PENDING
+
+    store.update_segment("录像", key, SEGMENT_CUT, cut_path="clip.mp4")
+    store.record_error("录像", key, "上传失败")
+    job = store.segments("录像")[key]
+    assert (job["stage"], job["cut_path"], job["error"]) == (SEGMENT_CUT, "clip.mp4", "上传失败")
+
+    # 重新分析给出同一分段时保留已有进度
+    assert store.add_segment("录像", key, "新标题") == SEGMENT_CUT
+    store.update_segment("录像", key, SEGMENT_UPLOADED, upload_id="BV1")
+    job = store.segments("录像")[key]
+    assert (job["stage"], job["upload_id"], job["error"]) == (SEGMENT_UPLOADED, "BV1", None)
+    assert store.unfinished("录像", [key, "other"]) == ["other"]
+
+    with pytest.raises(ValueError):
+        store.update_segment("录像", key, "unknown")
+    with pytest.raises(ValueError):
+        store.update_segment("录像", key, SEGMENT_CUT, title="标题")
+
+
+def test_recording_resumes_until_subtitles_change(store, srt_path):
+    store.open_recording("录像", srt_path)
+    store.add_segment("录像", "a", "已上传")
+    store.add_segment("录像", "b", "未上传")
+    store.update_segment("录像", "a", SEGMENT_UPLOADED, upload_id="BV1")
+    store.set_recording_stage("录像", RECORDING_ANALYZED)
+    assert store.open_recording("录像", srt_path) == RECORDING_ANALYZED
+    assert store.unfinished_recordings() == {"录像": srt_path}
+
+    # 字幕变化后重新处理，只保留已上传的分段
+    with open(srt_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    os.utime(srt_path, ns=(0, 0))
+    assert store.open_recording("录像", srt_path) == RECORDING_PENDING
+    assert list(store.segments("录像")) == ["a"]
+
+    store.set_recording_stage("录像", RECORDING_DONE)
+    assert store.unfinished_recordings() == {}
+    store.reset("录像")
+    assert store.segments("录像") == {}
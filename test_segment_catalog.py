@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from segment_catalog import SegmentCatalog, STATUS_CUT, STATUS_PENDING, STATUS_UPLOADED
+from segment_parser import Segment
+
+
+@pytest.fixture
+def catalog(tmp_path) -> SegmentCatalog:
+    return SegmentCatalog(str(tmp_path / "segments.sqlite3"))
+
+
+SEGMENTS = [
+    Segment("00:05:00,000", "00:09:00,000", "后面", "二"),
+    Segment("00:00:01,000", "00:03:00,000", "开头", "一"),
+]
+
+
+def test_segments_are_ordered_and_filtered(catalog):
+    assert catalog.add_segments("录像", SEGMENTS) == 2
+    assert [segment["title"] for segment in catalog.segments("录像")] == ["开头", "后面"]
+    assert [segment["title"] for segment in catalog.segments("录像", start_ms=60000)] == ["后面"]
+
+    # 重新分析时替换已有分段
+    catalog.add_segments("录像", SEGMENTS[:1], replace=True)
+    assert [segment["title"] for segment in catalog.segments("录像")] == ["后面"]
+
+
+def test_status_transitions(catalog):
+    catalog.add_segments("录像", [dict(vars(SEGMENTS[0]), status=STATUS_CUT), SEGMENTS[1]])
+    assert [segment["status"] for segment in catalog.segments("录像")] == [STATUS_PENDING, STATUS_CUT]
+
+    assert catalog.set_status_at("录像", "00:05:00,000", "00:09:00,000", STATUS_UPLOADED) == 1
+    assert catalog.set_status_at("录像", "00:00:00,000", "00:00:01,000", STATUS_UPLOADED) == 0
+    assert [segment["title"] for segment in catalog.segments("录像", status=STATUS_UPLOADED)] == ["后面"]
+
+    first = catalog.segments("录像")[0]
+    catalog.set_status([first["id"]], STATUS_CUT)
+    assert catalog.get(first["id"])["status"] == STATUS_CUT
+    with pytest.raises(ValueError):
+        catalog.set_status([first["id"]], "unknown")
+    with pytest.raises(ValueError):
+        catalog.update(first["id"], status="unknown")
+
+
+def test_update_keeps_range_query_in_sync(catalog):
+    catalog.add_segments("录像", SEGMENTS)
+    first = catalog.segments("录像")[0]
+    assert catalog.update(first["id"], start_time="00:10:00,000", end_time="00:12:00,000", title="改后")
+    assert [segment["title"] for segment in catalog.segments("录像")] == ["后面", "改后"]
+    assert not catalog.update(-1, title="不存在")
+
+
+def test_json_round_trip(catalog, tmp_path):
+    catalog.add_video("录像", video_path="录像.mp4")
+    catalog.add_segments("录像", SEGMENTS)
+    json_file = str(tmp_path / "录像_segments.json")
+    catalog.export_json("录像", json_file)
+    with open(json_file, encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["video_path"] == "录像.mp4"
+    assert data["total_segments"] == 2
+
+    other = SegmentCatalog(str(tmp_path / "other.sqlite3"))
+    assert other.import_json(json_file) == ("录像", 2)
+    assert other.video_info("录像") == data
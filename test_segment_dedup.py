@@ -0,0 +1,36 @@
+from segment_dedup import SegmentDeduper, dedupe_segments, overlap_ratio
+from segment_parser import Segment
+
+
+def _segment(start: str, end: str, title: str = "标题") -> Segment:
+    return Segment(f"00:{start},000", f"00:{end},000", title, "")
+
+
+def test_overlap_ratio():
+    assert overlap_ratio(0, 10, 0, 10) == 1
+    assert overlap_ratio(0, 10, 5, 15) == 5 / 15
+    assert overlap_ratio(0, 10, 10, 20) == 0
+
+
+def test_dedupe_keeps_longer_duplicate_and_sorts():
+    segments = [
+        _segment("05:00", "09:00", "后面"),
+        _segment("00:10", "03:00", "短"),
+        _segment("00:00", "03:00", "长"),
+    ]
+    assert [segment.title for segment in dedupe_segments(segments, 0.6)] == ["长", "后面"]
+
+
+def test_threshold_zero_still_drops_exact_duplicates():
+    segments = [_segment("00:00", "03:00"), _segment("00:10", "03:00"), _segment("00:00", "03:00")]
+    assert dedupe_segments(segments, 0) == segments[:2]
+    # 时间相同但标题不同的分段切到不同文件，不算完全相同
+    assert len(dedupe_segments([_segment("00:00", "03:00", "甲"), _segment("00:00", "03:00", "乙")], 0)) == 2
+
+
+def test_online_deduper_keeps_first_arrival():
+    deduper = SegmentDeduper(0.6)
+    assert deduper.add(_segment("00:10", "03:00", "先到"))
+    assert not deduper.add(_segment("00:00", "03:00", "后到"))
+    assert deduper.add(_segment("03:00", "06:00"))
+    assert [segment.title for segment in deduper.segments] == ["先到", "标题"]
@@ -0,0 +1,69 @@
+import io
+
+from analysis_sink import QwenResponse, render_response
+from segment_parser import Segment, SegmentExtractor, parse_analysis_lines
+
+RESPONSE = """分段1：
+- 时间：[00:00:01,000] --> [00:03:00,500]
+- 标题：开场闲聊
+- 内容概要：聊了最近的天气
+
+分段2：
+- 时间：[00:03:00,500] --> [00:08:00,000]
+- 标题：正题
+- 内容概要：
+  讲解了第一个观点
+  - 举了一个例子
+
+  - 给出了结论
+
+以上是分段结果，如需调整请告诉我。
+"""
+
+
+def _extract(text: str) -> list:
+    extractor = SegmentExtractor()
+    segments = extractor.feed(text)
+    segments.extend(extractor.finish())
+    return segments
+
+
+def test_summary_stops_before_trailing_text():
+    segments = _extract(RESPONSE)
+    assert segments == [
+        Segment("00:00:01,000", "00:03:00,500", "开场闲聊", "聊了最近的天气"),
+        Segment("00:03:00,500", "00:08:00,000", "正题", "讲解了第一个观点\n  - 举了一个例子\n\n  - 给出了结论"),
+    ]
+
+
+def test_trailing_text_without_blank_line():
+    segments = _extract("分段1：\n- 时间：[00:00:01,000] --> [00:00:09,000]\n- 标题：标题\n"
+                        "- 内容概要：概要\n以上是分段结果")
+    assert [segment.summary for segment in segments] == ["概要"]
+
+
+def test_streamed_segment_is_emitted_before_response_ends():
+    emitted = []
+    extractor = SegmentExtractor(on_segment=emitted.append)
+    # 增量在任意位置断开，第二个分段标题的换行到达时第一个分段即已完整
+    head = RESPONSE.index("分段2：") + len("分段2：\n")
+    for i in range(0, head, 7):
+        extractor.feed(RESPONSE[i:min(i + 7, head)])
+    assert [segment.title for segment in emitted] == ["开场闲聊"]
+    extractor.feed(RESPONSE[head:])
+    extractor.finish()
+    assert [segment.title for segment in emitted] == ["开场闲聊", "正题"]
+
+
+def test_multi_block_txt_uses_each_time_base():
+    content = "思考过程，不属于回复\n分段9：\n" + render_response(
+        QwenResponse("", "分段1：\n- 时间：[00:00:01,000] --> [00:00:05,000]\n- 标题：绝对\n- 内容概要：一",
+                     {"total_tokens": 10})
+    ) + render_response(
+        QwenResponse("", "分段1：\n- 时间：[+1.25] --> [+4.5]\n- 标题：相对\n- 内容概要：二"), origin_ms=60000
+    )
+    segments = list(parse_analysis_lines(io.StringIO(content)))
+    assert segments == [
+        (0, Segment("00:00:01,000", "00:00:05,000", "绝对", "一")),
+        (1, Segment("00:01:01,250", "00:01:04,500", "相对", "二")),
+    ]
@@ -0,0 +1,63 @@
+import re
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("numpy")
+
+from srt_reader import Cue  # noqa: E402
+from subtitle_process import chunk_cues, estimate_tokens, format_chunk, format_cue  # noqa: E402
+from timecode import TIME_BASE_MARKER, resolve_time  # noqa: E402
+
+
+def _cues(count: int, gap_every: int = 0) -> list:
+    """每条字幕1.8秒、间隔2秒，gap_every 条字幕后有一段5秒的停顿"""
+    cues, start = [], 0
+    for i in range(count):
+        cues.append(Cue(i + 1, start, start + 1800, f"第{i}句字幕"))
+        start += 5000 if gap_every and i % gap_every == gap_every - 1 else 2000
+    return cues
+
+
+def test_chunks_stay_within_budget_and_overlap():
+    cues = _cues(200)
+    budget = 300
+    chunks = list(chunk_cues(cues, budget, overlap=3))
+    assert len(chunks) > 1
+    previous = []
+    for chunk in chunks:
+        context = previous[-3:]
+        assert chunk[:len(context)] == context
+        new = chunk[len(context):]
+        assert sum(estimate_tokens(format_cue(cue)) for cue in chunk) <= budget
+        previous = new
+    # 去掉重叠部分后每条字幕恰好出现一次
+    assert [cue for i, chunk in enumerate(chunks) for cue in chunk[3 if i else 0:]] == cues
+
+
+def test_chunks_break_at_silence():
+    cues = _cues(200, gap_every=20)
+    budget = sum(estimate_tokens(format_cue(cue)) for cue in cues[:22])
+    for chunk in chunk_cues(cues, budget, overlap=0):
+        # 预算的80%之后遇到停顿即断开，每块都结束在停顿前
+        assert chunk[-1].index % 20 == 0 or chunk[-1] is cues[-1]
+
+
+def test_compact_chunk_round_trips_times():
+    cues = _cues(30)[10:]
+    full, compact = format_chunk(cues), format_chunk(cues, compact=True)
+    header, body = compact.split("\n", 1)
+    assert header.startswith(f"{TIME_BASE_MARKER}00:00:20,000")
+    assert estimate_tokens(body) < estimate_tokens(full)
+    times = re.findall(r"\[([+-][\d.]+) --> ([+-][\d.]+)\]", body)
+    origin_ms = cues[0].start_ms
+    assert [(resolve_time(start, origin_ms), resolve_time(end, origin_ms)) for start, end in times] == \
+        [(cue.start_ms, cue.end_ms) for cue in cues]
+
+
+def test_compact_times_lose_at_most_5ms():
+    cues = [Cue(1, 1000, 2049, "甲"), Cue(2, 2051, 3999, "乙")]
+    line = format_cue(cues[1], cues[0].start_ms)
+    assert line.startswith("[+1.05 --> +3.00]")
+    assert abs(resolve_time("+1.05", 1000) - 2051) <= 5
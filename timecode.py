@@ -0,0 +1,40 @@
+from typing import Optional
+
+# 紧凑时间戳模式下写在字幕块开头和分析结果中的时间基准标记
+TIME_BASE_MARKER = "时间基准："
+
+
+def format_srt_time(ms: int) -> str:
+    """毫秒转为 HH:MM:SS,mmm"""
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def parse_srt_time(time_str: str) -> int:
+    """HH:MM:SS,mmm / HH:MM:SS / MM:SS 转为毫秒"""
+    time = time_str.strip().strip('[]').replace('.', ',')
+    time, _, milliseconds = time.partition(',')
+    parts = [int(part) for part in time.split(':')]
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    hours, minutes, seconds = parts
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + int((milliseconds or '0').ljust(3, '0')[:3])
+
+
+def is_relative_time(time_str: str) -> bool:
+    time = time_str.strip().strip('[]')
+    return time.startswith('+') or (':' not in time and time.replace('.', '', 1).isdigit())
+
+
+def resolve_time(time_str: str, origin_ms: Optional[int] = None) -> int:
+    """
+    解析分析结果中的时间为绝对毫秒数
+    紧凑模式下的相对秒数(如 +12.34)加上时间基准还原为绝对时间
+    """
+    if is_relative_time(time_str):
+        if origin_ms is None:
+            raise ValueError(f"相对时间缺少时间基准: {time_str}")
+        return origin_ms + round(float(time_str.strip().strip('[]').lstrip('+')) * 1000)
+    return parse_srt_time(time_str)
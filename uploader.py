@@ -1,13 +1,19 @@
+import asyncio
 import os
+import re
 import subprocess
 import sys
-from typing import Optional
+from contextlib import suppress
+from typing import List, Optional
 from config import BILIBILI_CONFIG
 from logger import setup_logger
 from cover import CoverGenerator
 
 logger = setup_logger('uploader')
 
+# biliup 上传成功后输出的稿件BV号
+BVID_PATTERN = re.compile(r"BV[0-9A-Za-z]{10}")
+
 class BiliUploader:
     def __init__(self):
         self.biliup_path = BILIBILI_CONFIG["biliup_path"]
@@ -16,14 +22,16 @@ class BiliUploader:
         
         self.generator = CoverGenerator()
 
-    def _execute_command(self, command: list) -> None:
+    def _execute_command(self, command: list, cwd: Optional[str] = None) -> List[str]:
         try:
+            lines = []
             process = subprocess.Popen(
                 command,
                 text=True,
                 encoding='utf-8',
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT
+                stderr=subprocess.STDOUT,
+                cwd=cwd
             )
             
             while True:
@@ -32,62 +40,65 @@ class BiliUploader:
                     break
                 if output:
                     output = output.strip()
+                    lines.append(output)
                     logger.info(output)
                     print(output)
                     sys.stdout.flush()
 
             if process.returncode != 0:
                 raise subprocess.CalledProcessError(process.returncode, command)
-                
+            return lines
+
         except Exception as e:
             logger.error(f"命令执行失败: {str(e)}")
             raise
 
-    def upload(self, title: str, video_path: str, cover: Optional[str] = None) -> None:
+    def upload(self, title: str, video_path: str, cover: Optional[str] = None) -> Optional[str]:
+        """上传视频，返回稿件BV号，biliup没有输出BV号时返回 None"""
         try:
             if not os.path.exists(video_path):
                 raise FileNotFoundError(f"视频文件不存在: {video_path}")
 
-            # 切换到biliup目录
-            original_dir = os.getcwd()
-            os.chdir(self.biliup_path)
             # 如果没有提供封面，生成一个
             if not cover:
                 cover = self.generator.generate_cover(title=title)
 
+            # biliup在自己的目录中运行(读取登录信息)，不切换本进程的工作目录，多个上传可以同时进行
+            command = [
+                os.path.join(self.biliup_path, "biliup.exe"),
+                "upload",
+                "--tid", BILIBILI_CONFIG["tid"],
+                "--cover", os.path.abspath(cover),
+                "--title", f"{title}|孙尚书Plus",
+                "--tag", ",".join(BILIBILI_CONFIG["tags"]),
+                "--no-reprint", str(BILIBILI_CONFIG["no_reprint"]),
+                os.path.abspath(video_path)
+            ]
 
-
+            logger.info(f"开始上传视频: {title}")
             try:
-                # 构建上传命令
-                command = [
-                    "biliup.exe",
-                    "upload",
-                    "--tid", BILIBILI_CONFIG["tid"],
-                    "--cover", cover,
-                    "--title", f"{title}|孙尚书Plus",
-                    "--tag", ",".join(BILIBILI_CONFIG["tags"]),
-                    "--no-reprint", str(BILIBILI_CONFIG["no_reprint"]),
-                    video_path
-                ]
-
-                logger.info(f"开始上传视频: {title}")
-                self._execute_command(command)
-                logger.info(f"视频上传完成: {title}")
-                # 上传完成后删除封面
-                if cover:
-                    os.remove(cover)
+                output = self._execute_command(command, cwd=self.biliup_path)
             finally:
-                # 恢复原始工作目录
-                os.chdir(original_dir)
+                # 上传结束后删除封面，删除失败不能让已完成的上传被当作失败而重复投稿
+                with suppress(OSError):
+                    os.remove(cover)
+            bvid = None
+            for line in output:
+                match = BVID_PATTERN.search(line)
+                if match:
+                    bvid = match.group(0)
+            logger.info(f"视频上传完成: {title} {bvid or ''}")
+            return bvid
 
         except Exception as e:
             logger.error(f"上传失败 {title}: {str(e)}")
             raise
 
-async def upload(title: str, video_path: str) -> None:
+async def upload(title: str, video_path: str, cover: Optional[str] = None) -> Optional[str]:
+    """上传切片，cover 为已生成的封面，返回稿件BV号；上传在线程中进行，不阻塞事件循环"""
     try:
         uploader = BiliUploader()
-        uploader.upload(title, video_path)
+        return await asyncio.get_running_loop().run_in_executor(None, uploader.upload, title, video_path, cover)
     except Exception as e:
         logger.error(f"推送失败 {title}: {str(e)}")
         raise
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from config import WATCH_SETTINGS
+from logger import setup_logger
+
+logger = setup_logger('watcher')
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# 字幕和视频文件的大小与修改时间
+_Signature = Tuple[int, int, int, int]
+
+
+class RecordingWatcher:
+    """
+    监视输入目录，字幕和同名视频都已写完(大小和修改时间在 stable_seconds 内不再变化)时返回字幕路径
+    安装了 watchdog 时使用 inotify 等系统通知，文件一变化就重新检查；否则每 poll_interval 秒扫描一次目录
+    同一对文件只返回一次，文件再次变化后重新返回
+    """
+
+    def __init__(self, input_dir: str, video_extensions: Sequence[str], poll_interval: Optional[float] = None,
+                 stable_seconds: Optional[float] = None, use_notify: Optional[bool] = None):
+        self.input_dir = input_dir
+        self.video_extensions = tuple(video_extensions)
+        self.poll_interval = poll_interval or WATCH_SETTINGS["poll_interval"]
+        self.stable_seconds = WATCH_SETTINGS["stable_seconds"] if stable_seconds is None else stable_seconds
+        if use_notify is None:
+            use_notify = WATCH_SETTINGS["use_notify"]
+        self.use_notify = use_notify and Observer is not None
+        if use_notify and Observer is None:
+            logger.info("未安装watchdog，改为定时扫描目录")
+        # 等待稳定的文件：名称 -> (文件签名, 首次看到该签名的时间)
+        self._candidates: Dict[str, Tuple[_Signature, float]] = {}
+        # 已经返回过的文件：名称 -> 返回时的文件签名
+        self._submitted: Dict[str, _Signature] = {}
+
+    def _is_relevant(self, path: str) -> bool:
+        return path.endswith('.srt') or path.lower().endswith(self.video_extensions)
+
+    def _start_observer(self, loop: asyncio.AbstractEventLoop, wake: asyncio.Event):
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = (getattr(event, 'src_path', ''), getattr(event, 'dest_path', ''))
+                if not event.is_directory and any(path and watcher._is_relevant(path) for path in paths):
+                    # 通知来自watchdog的线程
+                    loop.call_soon_threadsafe(wake.set)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.input_dir, recursive=False)
+        observer.start()
+        return observer
+
+    def _scan(self) -> Tuple[list, bool]:
+        """扫描目录，返回 (已稳定的新字幕路径, 是否还有等待稳定的文件)"""
+        srt_files: Dict[str, os.DirEntry] = {}
+        videos: Dict[str, os.DirEntry] = {}
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stem, ext = os.path.splitext(entry.name)
+                if ext == '.srt':
+                    srt_files[stem] = entry
+                elif ext.lower() in self.video_extensions:
+                    videos[stem] = entry
+
+        ready = []
+        now = time.monotonic()
+        wall_now = time.time()
+        candidates = {}
+        for stem, srt_entry in srt_files.items():
+            video_entry = videos.get(stem)
+            if video_entry is None:
+                continue
+            srt_stat, video_stat = srt_entry.stat(), video_entry.stat()
+            signature = (srt_stat.st_size, srt_stat.st_mtime_ns, video_stat.st_size, video_stat.st_mtime_ns)
+            if self._submitted.get(stem) == signature:
+                continue
+            previous = self._candidates.get(stem)
+            first_seen = previous[1] if previous and previous[0] == signature else now
+            # 启动前就已写完的文件不必再等待
+            idle = max(now - first_seen, wall_now - max(srt_stat.st_mtime, video_stat.st_mtime))
+            if idle >= self.stable_seconds:
+                self._submitted[stem] = signature
+                ready.append(srt_entry.path)
+            else:
+                candidates[stem] = (signature, first_seen)
+        self._candidates = candidates
+        return sorted(ready), bool(candidates)
+
+    async def ready(self) -> AsyncIterator[str]:
+        """持续返回新写完的字幕路径，直到被取消"""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        observer = self._start_observer(loop, wake) if self.use_notify else None
+        logger.info(f"开始监视目录: {self.input_dir} ({'系统通知' if observer else '定时扫描'})")
+        try:
+            while True:
+                ready, waiting = await loop.run_in_executor(None, self._scan)
+                for srt_path in ready:
+                    logger.info(f"发现新录像: {srt_path}")
+                    yield srt_path
+                if waiting:
+                    # 有文件在等待稳定时，到期后再检查一次
+                    timeout = min(self.stable_seconds, self.poll_interval) if observer else self.poll_interval
+                else:
+                    # 使用系统通知时只在文件变化后扫描，仍定时扫描一次以防漏掉通知
+                    timeout = self.poll_interval * 10 if observer else self.poll_interval
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()